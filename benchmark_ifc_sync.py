@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+IFC Sync Benchmarks
+===================
+Timing comparisons for SimpleIFCSync performance work.
+
+Usage:
+    python benchmark_ifc_sync.py extract input/G55_ARK.ifc
+    python benchmark_ifc_sync.py workers input/G55_ARK.ifc
+    python benchmark_ifc_sync.py workflow input/G55_ARK.ifc
+    python benchmark_ifc_sync.py edits input/G55_ARK.ifc
+    python benchmark_ifc_sync.py volumes input/G55_ARK.ifc
+    python benchmark_ifc_sync.py filter input/G55_ARK.ifc
+    python benchmark_ifc_sync.py excel input/G55_ARK.ifc
+    python benchmark_ifc_sync.py excel-read input/G55_ARK.ifc   (synthetic workbook, IFC unused)
+    python benchmark_ifc_sync.py ifczip input/G55_ARK.ifc
+    python benchmark_ifc_sync.py roundtrip input/G55_ARK.ifc
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import ifcopenshell
+import ifcopenshell.api
+import ifcopenshell.util.element
+import pandas as pd
+
+from ifc_sync_simple import (IFCModelSession, PropertyEntityIndex, SimpleIFCSync, excel_reader_engine,
+                             read_property_sheet, open_ifc, select_products, write_excel_streaming,
+                             write_ifc_atomic)
+
+
+def timed(label: str, func, *args, **kwargs):
+    """Run func once and print wall time"""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    print(f"   {label:<32} {elapsed:8.2f} s")
+    return result, elapsed
+
+
+def _measure(func, *args):
+    """Run func in the current (fresh) process, return wall time and peak RSS in MB"""
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    try:
+        import resource
+    except ImportError:  # Windows
+        return elapsed, None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes on Linux
+    return elapsed, peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def isolated(label: str, func, *args):
+    """Run func in a separate process so peak RSS is not shared between variants"""
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        elapsed, peak_mb = pool.submit(_measure, func, *args).result()
+    peak = f"{peak_mb:8.0f} MB" if peak_mb is not None else "     n/a"
+    print(f"   {label:<32} {elapsed:8.2f} s   peak RSS {peak}")
+    return elapsed, peak_mb
+
+
+def bench_extract(sync: SimpleIFCSync, ifc_path: Path):
+    """Per-element traversal vs one-pass relationship index"""
+    print("\n📊 Extraction: per-element loop vs relationship index")
+    df_loop, t_loop = timed("per-element loop", sync.extract_ifc_to_excel, ifc_path, use_index=False)
+    df_index, t_index = timed("relationship index", sync.extract_ifc_to_excel, ifc_path, use_index=True)
+
+    print(f"   Speedup: {t_loop / t_index:.1f}x ({len(df_index)} elements)")
+
+    pd.testing.assert_frame_equal(df_loop, df_index, check_like=True)
+    print("   ✅ Output identical")
+
+
+def bench_workers(sync: SimpleIFCSync, ifc_path: Path):
+    """Scaling of sharded multi-process extraction over 1/2/4/8 workers"""
+    print("\n📊 Extraction scaling by worker processes")
+    baseline, t_serial = timed("1 worker (serial)", sync.extract_ifc_to_excel, ifc_path)
+
+    for workers in (2, 4, 8):
+        df, elapsed = timed(f"{workers} workers", sync.extract_ifc_to_excel, ifc_path, workers=workers)
+        pd.testing.assert_frame_equal(baseline, df)
+        print(f"   {'':<32} {t_serial / elapsed:8.1f}x vs serial")
+
+    print("   ✅ Output identical for all worker counts")
+
+
+def _workflow_two_opens(input_folder: str, ifc_name: str):
+    """Previous behaviour: each stage parses the IFC itself"""
+    sync = SimpleIFCSync(input_folder=input_folder, output_folder="output")
+    ifc_path = sync.input_folder / ifc_name
+    df = sync.extract_ifc_to_excel(ifc_path)
+    sync.create_analysis_ifc(ifc_path, df)
+
+
+def _workflow_shared_session(input_folder: str, ifc_name: str):
+    """Extract + create on one IFCModelSession, as run_workflow does (its other stages left out)"""
+    sync = SimpleIFCSync(input_folder=input_folder, output_folder="output")
+    ifc_path = sync.input_folder / ifc_name
+    with IFCModelSession(ifc_path) as session:
+        df = sync.extract_ifc_to_excel(ifc_path, ifc=session.ifc)
+        sync.create_analysis_ifc(ifc_path, df, ifc=session.ifc)
+
+
+def bench_workflow(sync: SimpleIFCSync, ifc_path: Path):
+    """Wall time and peak RSS of the extract + create stages: two opens vs shared session"""
+    print("\n📊 Workflow: open per stage vs shared model session")
+    args = (str(sync.input_folder), ifc_path.name)
+    t_two, rss_two = isolated("open per stage", _workflow_two_opens, *args)
+    t_shared, rss_shared = isolated("shared session", _workflow_shared_session, *args)
+
+    print(f"   Wall time: {t_two - t_shared:+.2f} s saved ({t_two / t_shared:.1f}x)")
+    if rss_two is not None:
+        print(f"   Peak RSS: {rss_two - rss_shared:+.0f} MB saved")
+
+
+def _edit_via_api(ifc: ifcopenshell.file, guids: list, statuses: list):
+    """Previous edit path: get_psets + IsDefinedBy scan + pset.edit_pset per edit"""
+    for guid, status in zip(guids, statuses):
+        element = ifc.by_guid(guid)
+        if 'G55_LCA' in ifcopenshell.util.element.get_psets(element):
+            pset_rels = [p for p in element.IsDefinedBy
+                         if p.is_a("IfcRelDefinesByProperties")
+                         and p.RelatingPropertyDefinition.Name == "G55_LCA"]
+            if pset_rels:
+                ifcopenshell.api.run("pset.edit_pset", ifc, pset=pset_rels[0].RelatingPropertyDefinition,
+                                     properties={'Gjenbruksstatus': status})
+
+
+def _edit_via_index(index: PropertyEntityIndex, guids: list, statuses: list):
+    for guid, status in zip(guids, statuses):
+        index.set_value(guid, 'G55_LCA', 'Gjenbruksstatus', status)
+
+
+def bench_edits(sync: SimpleIFCSync, ifc_path: Path, num_edits: int = 10_000):
+    """10k Gjenbruksstatus edits: API path vs PropertyEntityIndex"""
+    print(f"\n📊 {num_edits} property edits: ifcopenshell.api vs property entity index")
+    analysis_path = sync.create_analysis_ifc(ifc_path)
+    ifc = ifcopenshell.open(str(analysis_path))
+
+    products = [p.GlobalId for p in select_products(ifc)]
+    guids = [products[i % len(products)] for i in range(num_edits)]
+    statuses = [('NY', 'EKS', 'GJEN')[i % 3] for i in range(num_edits)]
+
+    _, t_api = timed("get_psets + edit_pset", _edit_via_api, ifc, guids, statuses)
+    index, t_build = timed("index build (once per load)", PropertyEntityIndex, ifc)
+    _, t_index = timed("index set_value", _edit_via_index, index, guids, statuses)
+
+    print(f"   Per edit: {t_api / num_edits * 1e6:.0f} µs → {t_index / num_edits * 1e6:.1f} µs "
+          f"({t_api / t_index:.0f}x, {t_api / (t_build + t_index):.0f}x including build)")
+
+
+def bench_volumes(sync: SimpleIFCSync, ifc_path: Path):
+    """Geometry volume throughput (elements/s) by tessellation threads"""
+    print("\n📊 Geometry volumes: elements/s by iterator threads")
+    ifc = ifcopenshell.open(str(ifc_path))
+    cores = os.cpu_count() or 1
+
+    for threads in sorted({1, cores}):
+        volumes, elapsed = timed(f"{threads} thread(s)", sync.compute_geometry_volumes, ifc_path,
+                                 ifc=ifc, threads=threads, use_cache=False)
+        print(f"   {'':<32} {len(volumes) / elapsed:8.0f} elements/s")
+
+    sync.compute_geometry_volumes(ifc_path, ifc=ifc)  # populate cache
+    timed("cache hit", sync.compute_geometry_volumes, ifc_path, ifc=ifc)
+    # Different filters miss the per-file entry but hit every geometry hash (like a new revision)
+    timed("geometry hash hit", sync.compute_geometry_volumes, ifc_path, ifc=ifc, exclude_types=('IfcSpace',))
+    print(f"   {len(volumes)} volumes, {volumes.isna().sum()} without a closed mesh")
+
+
+def bench_filter(sync: SimpleIFCSync, ifc_path: Path):
+    """Every IfcProduct vs the LCA building-element default"""
+    print("\n📊 Extraction: all products vs building elements only")
+    df_all, t_all = timed("all IfcProduct", sync.extract_ifc_to_excel, ifc_path, include_types=None)
+    df_lca, t_lca = timed("building elements (default)", sync.extract_ifc_to_excel, ifc_path)
+
+    print(f"   {len(df_all)} → {len(df_lca)} elements, {t_all / t_lca:.1f}x faster")
+    skipped = df_all.loc[~df_all['GUID'].isin(df_lca['GUID']), 'Entity'].astype(str).value_counts().head(10)
+    print("   Skipped entity types:")
+    for entity, count in skipped.items():
+        print(f"      {entity:<29} {count:8d}")
+
+
+def _save_excel(df: pd.DataFrame, excel_path: str, streaming: bool):
+    sync = SimpleIFCSync(input_folder="input", output_folder="output")
+    if not sync.save_dataframe_to_excel(df, Path(excel_path), streaming=streaming):
+        raise RuntimeError(f"Excel save failed: {excel_path}")
+
+
+def bench_excel(sync: SimpleIFCSync, ifc_path: Path):
+    """save_dataframe_to_excel: in-memory openpyxl workbook vs write-only streaming"""
+    print("\n📊 Excel export: pd.ExcelWriter vs streaming write-only workbook")
+    df = sync.extract_ifc_to_excel(ifc_path, include_types=None)
+    print(f"   {len(df)} rows × {len(df.columns)} columns")
+
+    in_memory = sync.output_folder / "bench_excel_openpyxl.xlsx"
+    streamed = sync.output_folder / "bench_excel_streaming.xlsx"
+    t_memory, rss_memory = isolated("pd.ExcelWriter (openpyxl)", _save_excel, df, str(in_memory), False)
+    t_stream, rss_stream = isolated("write-only streaming", _save_excel, df, str(streamed), True)
+
+    print(f"   Wall time: {t_memory / t_stream:.1f}x")
+    if rss_memory is not None:
+        print(f"   Peak RSS: {rss_memory - rss_stream:+.0f} MB saved")
+
+    pd.testing.assert_frame_equal(pd.read_excel(in_memory), pd.read_excel(streamed))
+    print("   ✅ Workbooks read back identical")
+
+
+def _synthetic_workbook(path: Path, rows: int = 13_000, prop_cols: int = 200):
+    """Extraction-shaped workbook: element columns plus prop_cols "Pset.Prop" columns"""
+    data = {
+        'GUID': [f"2O2Fr$t4X7Zf8NOew3FL{i:04d}" for i in range(rows)],
+        'Entity': ['IfcWall', 'IfcSlab', 'IfcBeam', 'IfcColumn'] * (rows // 4) + ['IfcWall'] * (rows % 4),
+        'Name': [f"Element {i}" for i in range(rows)],
+        'Volume_m3': [i * 0.01 for i in range(rows)],
+    }
+    for col in range(prop_cols):
+        pset = f"Pset_{col // 20}"
+        data[f"{pset}.Prop_{col}"] = ([i % 97 for i in range(rows)] if col % 2
+                                      else [f"Verdi {i % 13}" for i in range(rows)])
+    write_excel_streaming(pd.DataFrame(data), path)
+
+
+def bench_excel_read(sync: SimpleIFCSync, ifc_path: Path):
+    """sync_excel_to_ifc reader on a 13k × 200 workbook: full read vs usecols (openpyxl/calamine)"""
+    print("\n📊 Excel read: 13k rows × 200 property columns")
+    path = sync.output_folder / "bench_excel_read.xlsx"
+    if not path.exists():
+        timed("build workbook", _synthetic_workbook, path)
+
+    full, t_full = timed("pd.read_excel (openpyxl, all)", pd.read_excel, path)
+    subset, t_subset = timed("usecols + dtype (openpyxl)", read_property_sheet, path, 'openpyxl')
+    print(f"   {'':<32} {t_full / t_subset:8.1f}x")
+
+    if excel_reader_engine() == 'calamine':
+        fast, t_fast = timed("usecols + dtype (calamine)", read_property_sheet, path, 'calamine')
+        print(f"   {'':<32} {t_full / t_fast:8.1f}x")
+        pd.testing.assert_frame_equal(subset, fast, check_dtype=False)
+        print("   ✅ calamine and openpyxl read identical values")
+    else:
+        print("   (install python-calamine to compare the calamine engine)")
+
+    assert list(subset.columns) == [col for col in full.columns if col == 'GUID' or '.' in col]
+
+
+def bench_ifczip(sync: SimpleIFCSync, ifc_path: Path):
+    """Analysis IFC write time vs file size: STEP vs ifcZIP at deflate levels 1/6/9"""
+    print("\n📊 Analysis IFC: write time vs size (.ifc vs .ifczip)")
+    analysis_path = sync.create_analysis_ifc(ifc_path)
+    ifc = ifcopenshell.open(str(analysis_path))
+
+    step_path = sync.output_folder / "bench_analysis.ifc"
+    _, t_step = timed(".ifc (STEP)", write_ifc_atomic, ifc, step_path)
+    step_mb = step_path.stat().st_size / 1024 / 1024
+    print(f"   {'':<32} {step_mb:8.1f} MB")
+
+    zip_path = sync.output_folder / "bench_analysis.ifczip"
+    for level in (1, 6, 9):
+        _, elapsed = timed(f".ifczip (level {level})", write_ifc_atomic, ifc, zip_path, level)
+        zip_mb = zip_path.stat().st_size / 1024 / 1024
+        print(f"   {'':<32} {zip_mb:8.1f} MB ({step_mb / zip_mb:.1f}x smaller, {elapsed - t_step:+.2f} s)")
+
+    reopened, _ = timed("open .ifczip", open_ifc, zip_path)
+    assert len(reopened.by_type("IfcProduct")) == len(ifc.by_type("IfcProduct"))
+    print("   ✅ ifcZIP reopens with the same products")
+
+
+def bench_roundtrip(sync: SimpleIFCSync, ifc_path: Path):
+    """Excel export synced back without edits must leave the analysis IFC untouched"""
+    print("\n📊 Excel round trip: export → sync without edits")
+    result = sync.run_workflow(ifc_path.name, use_cache=False)
+    analysis_path = result['analysis_ifc']
+    excel_path = sync.output_folder / "bench_roundtrip.xlsx"
+    assert sync.save_dataframe_to_excel(result['dataframe'], excel_path)
+    sync.flush_writes()
+    written = analysis_path.stat().st_mtime_ns
+
+    # A second pass catches edits that do not settle (e.g. values re-typed on every sync)
+    for attempt in (1, 2):
+        ok, _ = timed(f"sync #{attempt}", sync.sync_excel_to_ifc, excel_path, analysis_path)
+        sync.flush_writes()
+        assert ok, f"sync #{attempt} failed"
+        assert analysis_path.stat().st_mtime_ns == written, f"sync #{attempt} rewrote the analysis IFC"
+
+    print("   ✅ Unedited sheet changes nothing")
+
+
+BENCHMARKS = {
+    'extract': bench_extract,
+    'workers': bench_workers,
+    'workflow': bench_workflow,
+    'edits': bench_edits,
+    'volumes': bench_volumes,
+    'filter': bench_filter,
+    'excel': bench_excel,
+    'excel-read': bench_excel_read,
+    'ifczip': bench_ifczip,
+    'roundtrip': bench_roundtrip,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SimpleIFCSync")
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('ifc_file', type=Path, help="IFC file to benchmark against")
+    args = parser.parse_args()
+
+    sync = SimpleIFCSync(input_folder=str(args.ifc_file.parent), output_folder="output")
+    BENCHMARKS[args.benchmark](sync, args.ifc_file)
+
+
+if __name__ == "__main__":
+    main()
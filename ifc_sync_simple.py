@@ -12,21 +12,1343 @@ No Dalux dependency - works with local files
 
 import ifcopenshell
 import ifcopenshell.util.element
-import ifcopenshell.api
+import ifcopenshell.util.unit
+import ifcopenshell.guid
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
 from typing import Optional
+import atexit
+import hashlib
+import json
 import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import weakref
+import zipfile
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Bump when extraction output changes, so cached extractions are not reused
+EXTRACTOR_VERSION = "3"
+
+# Repeated string columns stored as categoricals in extracted frames
+CATEGORICAL_COLUMNS = ('Entity', 'Type', 'Material', 'Floor', 'Zone', 'G55_LCA.Gjenbruksstatus')
+
+# Values the dashboard may assign to G55_LCA.Gjenbruksstatus
+GJENBRUKSSTATUS_VALUES = ('NY', 'EKS', 'GJEN')
+
+# Typed quantity columns from IfcElementQuantity:
+# column -> (quantity entity, value attribute, unit type, name suffix, preferred names)
+QUANTITY_COLUMNS = {
+    'Volume_m3': ('IfcQuantityVolume', 'VolumeValue', 'VOLUMEUNIT', 'Volume', ('NetVolume', 'GrossVolume')),
+    'Area_m2': ('IfcQuantityArea', 'AreaValue', 'AREAUNIT', 'Area',
+                ('NetSideArea', 'NetArea', 'GrossSideArea', 'GrossArea')),
+    'Length_m': ('IfcQuantityLength', 'LengthValue', 'LENGTHUNIT', 'Length', ('Length', 'NetLength', 'GrossLength')),
+    'Weight_kg': ('IfcQuantityWeight', 'WeightValue', 'MASSUNIT', 'Weight', ('NetWeight', 'GrossWeight')),
+}
+
+# Spatial container elements that don't have ContainedInStructure relationship
+SPATIAL_ELEMENTS = frozenset(('IfcSite', 'IfcBuilding', 'IfcBuildingStorey', 'IfcSpace', 'IfcZone'))
+
+# File formats for saved analysis sessions (see SimpleIFCSync.save_dataframe)
+SESSION_FORMATS = ('parquet', 'feather')
+
+# Arrow schema metadata key holding df.attrs in saved sessions
+FRAME_ATTRS_KEY = b'lca_flow.attrs'
+
+# Property name fragments identifying the authoring tool's element ID (see get_bim_id)
+BIM_ID_PROPERTY_MARKERS = ('ELEMENTID', 'REVITID', 'BATID')
+
+# Entity types extracted for LCA by default: physical building elements
+# (IfcBuiltElement is the IFC4x3 name of IfcBuildingElement)
+LCA_ENTITY_TYPES = ('IfcBuildingElement', 'IfcBuiltElement')
+
+
+def select_products(ifc: ifcopenshell.file, include_types: tuple = LCA_ENTITY_TYPES,
+                    exclude_types: tuple = None) -> list:
+    """
+    Products of the included entity types (and their subtypes), minus excluded types
+
+    Applied before any per-element work, so annotations, grids, openings,
+    ports and spatial elements cost nothing when not included. Types that are
+    not in the file's schema are skipped. include_types None selects every
+    IfcProduct.
+    """
+    if include_types is None:
+        products = ifc.by_type("IfcProduct")
+    else:
+        seen = set()
+        products = []
+        for entity in include_types:
+            try:
+                found = ifc.by_type(entity)
+            except RuntimeError:  # not in this schema
+                continue
+            for product in found:
+                if product.id() not in seen:
+                    seen.add(product.id())
+                    products.append(product)
+
+    if exclude_types:
+        products = [product for product in products
+                    if not any(product.is_a(entity) for entity in exclude_types)]
+    return products
+
+
+def resolve_material_names(material: ifcopenshell.entity_instance) -> list:
+    """
+    Resolve a material select (IfcMaterial, layer/profile/constituent set, usage
+    or list) to material names, mirroring ifcopenshell.util.element.get_materials
+    """
+    if material.is_a("IfcMaterial"):
+        materials = [material]
+    elif material.is_a("IfcMaterialLayerSetUsage"):
+        materials = [layer.Material for layer in material.ForLayerSet.MaterialLayers or []]
+    elif material.is_a("IfcMaterialLayerSet"):
+        materials = [layer.Material for layer in material.MaterialLayers or []]
+    elif material.is_a("IfcMaterialProfileSetUsage"):
+        materials = [profile.Material for profile in material.ForProfileSet.MaterialProfiles or []]
+    elif material.is_a("IfcMaterialProfileSet"):
+        materials = [profile.Material for profile in material.MaterialProfiles or []]
+    elif material.is_a("IfcMaterialConstituentSet"):
+        materials = [constituent.Material for constituent in material.MaterialConstituents or []]
+    elif material.is_a("IfcMaterialList"):
+        materials = list(material.Materials or [])
+    else:
+        materials = []
+    return [mat.Name for mat in materials if hasattr(mat, 'Name')]
+
+
+def _material_name(material: Optional[ifcopenshell.entity_instance]) -> Optional[str]:
+    return getattr(material, 'Name', None) if material is not None else None
+
+
+def material_layer_rows(material: ifcopenshell.entity_instance, length_scale: float = 1.0) -> list:
+    """
+    (material name, thickness in m, volume fraction) per layer/constituent of a material select
+
+    Layer fractions are thickness shares of the layer set. Constituents use
+    their Fraction when all are given, profiles/lists/constituents otherwise
+    get equal shares. Thickness is None where the material has no layers.
+    """
+    if material.is_a("IfcMaterialLayerSetUsage"):
+        material = material.ForLayerSet
+    elif material.is_a("IfcMaterialProfileSetUsage"):
+        material = material.ForProfileSet
+
+    if material.is_a("IfcMaterial"):
+        return [(material.Name, None, 1.0)]
+
+    if material.is_a("IfcMaterialLayerSet"):
+        layers = material.MaterialLayers or []
+        thicknesses = [(layer.LayerThickness or 0.0) * length_scale for layer in layers]
+        total = sum(thicknesses)
+        return [(_material_name(layer.Material), thickness, thickness / total if total else 1 / len(layers))
+                for layer, thickness in zip(layers, thicknesses)]
+
+    if material.is_a("IfcMaterialConstituentSet"):
+        constituents = material.MaterialConstituents or []
+        if not constituents:
+            return []
+        fractions = [getattr(constituent, 'Fraction', None) for constituent in constituents]
+        if None not in fractions and sum(fractions) > 0:
+            total = sum(fractions)
+            fractions = [fraction / total for fraction in fractions]
+        else:
+            fractions = [1 / len(constituents)] * len(constituents)
+        return [(_material_name(constituent.Material), None, fraction)
+                for constituent, fraction in zip(constituents, fractions)]
+
+    if material.is_a("IfcMaterialProfileSet"):
+        parts = [profile.Material for profile in material.MaterialProfiles or []]
+    elif material.is_a("IfcMaterialList"):
+        parts = list(material.Materials or [])
+    else:
+        parts = []
+    return [(_material_name(part), None, 1 / len(parts)) for part in parts]
+
+
+def product_material_selects(ifc: ifcopenshell.file, types: dict = None) -> dict:
+    """
+    Material select per product GUID: direct association wins, otherwise inherited from the type
+
+    Args:
+        ifc: Model to scan
+        types: Optional product id → element type map (built from IfcRelDefinesByType if None)
+    """
+    if types is None:
+        types = {}
+        for rel in ifc.by_type("IfcRelDefinesByType"):
+            for obj in rel.RelatedObjects or []:
+                types.setdefault(obj.id(), rel.RelatingType)
+
+    material_by_id = {}
+    for rel in ifc.by_type("IfcRelAssociatesMaterial"):
+        for obj in rel.RelatedObjects or []:
+            material_by_id.setdefault(obj.id(), rel.RelatingMaterial)
+
+    selects = {}
+    for product in ifc.by_type("IfcProduct"):
+        material = material_by_id.get(product.id())
+        if material is None:
+            element_type = types.get(product.id())
+            if element_type is not None:
+                material = material_by_id.get(element_type.id())
+        if material is not None:
+            selects[product.GlobalId] = material
+    return selects
+
+
+def material_volumes(elements: pd.DataFrame, layers: pd.DataFrame, columns: tuple = ()) -> pd.DataFrame:
+    """
+    Volume per element × material, splitting element volume over its layers
+
+    Elements in layers (see SimpleIFCSync.extract_material_layers) get
+    Volume_m3 × Fraction per layer; other elements keep their Material and
+    full volume. Returns GUID, Material, Volume_m3 and the element columns
+    named in columns (e.g. Entity or a status), repeated on every layer row so
+    grouped aggregations can split by them.
+    """
+    unique = elements.drop_duplicates('GUID').set_index('GUID')
+    volumes = unique['Volume_m3'].astype('float64')
+    layered = layers[layers['GUID'].isin(volumes.index)]
+    layered_guids = layered['GUID'].astype(str)
+    split = pd.DataFrame({
+        'GUID': layered_guids,
+        'Material': layered['Material'].astype(object),
+        'Volume_m3': layered_guids.map(volumes) * layered['Fraction'],
+    })
+    for col in columns:
+        split[col] = layered_guids.map(unique[col].astype(object))
+    whole = elements.loc[~elements['GUID'].isin(layered_guids), ['GUID', 'Material', 'Volume_m3', *columns]]
+    whole = whole.assign(Material=whole['Material'].astype(object))
+    return pd.concat([split, whole], ignore_index=True)
+
+
+def _without_ids(value):
+    """Hashable form of a get_psets value with STEP ids removed (they change between exports)"""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _without_ids(item)) for key, item in value.items() if key != 'id'))
+    if isinstance(value, (list, tuple)):
+        return tuple(_without_ids(item) for item in value)
+    return value
+
+
+def _step_digest(value, memo: dict) -> str:
+    """Digest of an attribute value with referenced entities digested by content, not STEP id"""
+    if isinstance(value, ifcopenshell.entity_instance):
+        if not value.id():
+            # Inline typed value (e.g. IfcLengthMeasure in a select)
+            return repr((value.is_a(), value.wrappedValue))
+        digest = memo.get(value.id())
+        if digest is None:
+            content = [value.is_a()] + [_step_digest(value[i], memo) for i in range(len(value))]
+            digest = memo[value.id()] = hashlib.sha1(repr(content).encode()).hexdigest()
+        return digest
+    if isinstance(value, tuple) and value and isinstance(value[0], (ifcopenshell.entity_instance, tuple)):
+        return repr([_step_digest(item, memo) for item in value])
+    # Scalars and flat lists (coordinates, indices)
+    return repr(value)
+
+
+def geometry_hash(product: ifcopenshell.entity_instance, memo: dict, length_scale: float = 1.0) -> str:
+    """
+    Digest of what a product's tessellated volume depends on
+
+    Covers the shape representation (mapped items included) and the openings
+    voiding it with their relative placement, but not the product's own
+    placement or STEP ids, so a moved or re-exported element hashes the same.
+    memo caches entity digests across products that share geometry.
+    """
+    openings = []
+    for rel in getattr(product, 'HasOpenings', None) or []:
+        opening = rel.RelatedOpeningElement
+        placement = getattr(opening.ObjectPlacement, 'RelativePlacement', None)
+        openings.append((_step_digest(opening.Representation, memo), _step_digest(placement, memo)))
+    content = (repr(length_scale), _step_digest(product.Representation, memo), tuple(sorted(openings)))
+    return hashlib.sha1(repr(content).encode()).hexdigest()
+
+
+class IFCRelationshipIndex:
+    """
+    One-pass relationship index for fast extraction
+
+    Scans IfcRelContainedInSpatialStructure, IfcRelAssignsToGroup,
+    IfcRelAssociatesMaterial, IfcRelDefinesByType and IfcRelDefinesByProperties
+    once, so per-element lookups are dictionary joins instead of inverse traversals.
+
+    Maps (keyed by GUID):
+    - storeys: containing IfcBuildingStorey name
+    - spaces: containing IfcSpace name
+    - zones: assigned IfcZone name
+    - materials: list of material names (inherited from type if not set)
+    - get_psets(): property sets, same shape as ifcopenshell.util.element.get_psets
+    - content_hash(): digest of everything the extraction row is built from
+    """
+
+    def __init__(self, ifc: ifcopenshell.file):
+        self.storeys = {}
+        self.spaces = {}
+        self.zones = {}
+        self.materials = {}
+        self._types = {}
+        self._definitions = {}
+        self._definition_cache = {}
+        self._digest_cache = {}
+        self._type_psets_cache = {}
+        self._build(ifc)
+
+    def _build(self, ifc: ifcopenshell.file):
+        for rel in ifc.by_type("IfcRelContainedInSpatialStructure"):
+            structure = rel.RelatingStructure
+            if structure.is_a('IfcBuildingStorey'):
+                target = self.storeys
+            elif structure.is_a('IfcSpace'):
+                target = self.spaces
+            else:
+                continue
+            for element in rel.RelatedElements or []:
+                target.setdefault(element.GlobalId, structure.Name)
+
+        for rel in ifc.by_type("IfcRelAssignsToGroup"):
+            group = rel.RelatingGroup
+            if group is not None and group.is_a('IfcZone'):
+                for obj in rel.RelatedObjects or []:
+                    if hasattr(obj, 'GlobalId'):
+                        self.zones.setdefault(obj.GlobalId, group.Name)
+
+        for rel in ifc.by_type("IfcRelDefinesByType"):
+            for obj in rel.RelatedObjects or []:
+                self._types.setdefault(obj.id(), rel.RelatingType)
+
+        for rel in ifc.by_type("IfcRelDefinesByProperties"):
+            definition = rel.RelatingPropertyDefinition
+            # IFC4 allows a set of definitions (IfcPropertySetDefinitionSet)
+            definitions = definition if isinstance(definition, tuple) else (definition,)
+            for obj in rel.RelatedObjects or []:
+                self._definitions.setdefault(obj.id(), []).extend(definitions)
+
+        # Materials: direct association wins, otherwise inherit from the type
+        names_cache = {}
+        for guid, material in product_material_selects(ifc, self._types).items():
+            if material.id() not in names_cache:
+                names_cache[material.id()] = resolve_material_names(material)
+            self.materials[guid] = names_cache[material.id()]
+
+        logger.info(f"Indexed {len(self.storeys)} storey, {len(self.zones)} zone, "
+                    f"{len(self.materials)} material and {len(self._definitions)} pset assignments")
+
+    def _property_definition(self, definition: ifcopenshell.entity_instance) -> dict:
+        """Property values of one pset/qto, cached since type psets are shared"""
+        props = self._definition_cache.get(definition.id())
+        if props is None:
+            props = ifcopenshell.util.element.get_property_definition(definition)
+            self._definition_cache[definition.id()] = props
+        return props
+
+    def _definition_digest(self, definition: ifcopenshell.entity_instance) -> str:
+        """Digest of one pset/qto's name and values, cached since type psets are shared"""
+        digest = self._digest_cache.get(definition.id())
+        if digest is None:
+            content = (definition.Name, _without_ids(self._property_definition(definition)))
+            digest = hashlib.sha1(repr(content).encode()).hexdigest()
+            self._digest_cache[definition.id()] = digest
+        return digest
+
+    def content_hash(self, product: ifcopenshell.entity_instance) -> str:
+        """
+        Digest of a product's extracted content
+
+        Covers entity, Name, ObjectType, Tag, storey/space/zone, materials and
+        the values of type and occurrence psets/qtos, but not STEP ids, so an
+        unchanged element hashes the same in a re-exported revision.
+        """
+        guid = product.GlobalId
+        element_type = self._types.get(product.id())
+        definitions = list(getattr(element_type, 'HasPropertySets', None) or []) if element_type is not None else []
+        definitions += self._definitions.get(product.id(), [])
+        content = (
+            product.is_a(), getattr(product, 'Name', None), getattr(product, 'ObjectType', None),
+            getattr(product, 'Tag', None), self.storeys.get(guid), self.spaces.get(guid), self.zones.get(guid),
+            tuple(self.materials.get(guid) or ()),
+            tuple(sorted(self._definition_digest(definition) for definition in definitions)),
+        )
+        return hashlib.sha1(repr(content).encode()).hexdigest()
+
+    def get_psets(self, product: ifcopenshell.entity_instance) -> dict:
+        """Property sets for a product, type psets first then occurrence overrides"""
+        psets = {}
+        element_type = self._types.get(product.id())
+        if element_type is not None:
+            type_psets = self._type_psets_cache.get(element_type.id())
+            if type_psets is None:
+                type_psets = {}
+                for definition in getattr(element_type, 'HasPropertySets', None) or []:
+                    type_psets[definition.Name] = self._property_definition(definition)
+                self._type_psets_cache[element_type.id()] = type_psets
+            psets = {name: dict(props) for name, props in type_psets.items()}
+
+        for definition in self._definitions.get(product.id(), []):
+            psets.setdefault(definition.Name, {}).update(self._property_definition(definition))
+        return psets
+
+
+def quantity_unit_scales(ifc: ifcopenshell.file) -> dict:
+    """
+    Factor per quantity column converting project units to m, m², m³ and kg
+
+    Unit types without a project unit assignment are taken as SI (factor 1).
+    """
+    assigned = {unit.UnitType for assignment in ifc.by_type("IfcUnitAssignment")
+                for unit in assignment.Units or [] if hasattr(unit, 'UnitType')}
+    scales = {}
+    for column, (_, _, unit_type, _, _) in QUANTITY_COLUMNS.items():
+        if unit_type not in assigned:
+            scales[column] = 1.0
+            continue
+        scale = ifcopenshell.util.unit.calculate_unit_scale(ifc, unit_type)
+        # The SI base unit for mass is the gram
+        scales[column] = scale / 1000 if unit_type == 'MASSUNIT' else scale
+    return scales
+
+
+def extract_quantities(ifc: ifcopenshell.file) -> pd.DataFrame:
+    """
+    Volume_m3, Area_m2, Length_m and Weight_kg per element from IfcElementQuantity
+
+    One pass over IfcRelDefinesByProperties; quantity values are read as
+    numbers and scaled to SI once per file (see quantity_unit_scales). Per
+    column, the preferred names in QUANTITY_COLUMNS win (net before gross),
+    then any other quantity of that type whose name ends with the suffix
+    (e.g. OuterSurfaceArea). Width/Height/Depth are not taken as Length_m.
+
+    Returns a float64 frame indexed by GUID, NaN where an element has no
+    matching quantity.
+    """
+    scales = quantity_unit_scales(ifc)
+    columns_by_entity = {spec[0]: column for column, spec in QUANTITY_COLUMNS.items()}
+    best = {column: {} for column in QUANTITY_COLUMNS}
+
+    for rel in ifc.by_type("IfcRelDefinesByProperties"):
+        definition = rel.RelatingPropertyDefinition
+        definitions = definition if isinstance(definition, tuple) else (definition,)
+
+        picked = {}
+        for qto in definitions:
+            if not qto.is_a("IfcElementQuantity"):
+                continue
+            for quantity in qto.Quantities or []:
+                column = columns_by_entity.get(quantity.is_a())
+                if column is None:
+                    continue
+                _, attribute, _, suffix, preferred = QUANTITY_COLUMNS[column]
+                name = quantity.Name or ''
+                if name in preferred:
+                    rank = preferred.index(name)
+                elif name.endswith(suffix):
+                    rank = len(preferred)
+                else:
+                    continue
+                value = getattr(quantity, attribute)
+                if value is not None and (column not in picked or rank < picked[column][0]):
+                    picked[column] = (rank, value)
+
+        if not picked:
+            continue
+        for obj in rel.RelatedObjects or []:
+            guid = getattr(obj, 'GlobalId', None)
+            if guid is None:
+                continue
+            for column, candidate in picked.items():
+                current = best[column].get(guid)
+                if current is None or candidate[0] < current[0]:
+                    best[column][guid] = candidate
+
+    guids = sorted(set().union(*best.values()))
+    quantities = pd.DataFrame(
+        {column: pd.Series({guid: value * scales[column] for guid, (_, value) in values.items()},
+                           index=guids, dtype='float64')
+         for column, values in best.items()},
+        index=pd.Index(guids, name='GUID'),
+    )
+    logger.info(f"Extracted quantities for {len(quantities)} elements")
+    return quantities
+
+
+def insert_quantity_columns(df: pd.DataFrame, quantities: pd.DataFrame) -> pd.DataFrame:
+    """Insert the quantity columns after Zone (or at the end), matched on GUID"""
+    if 'GUID' not in df.columns:
+        return df
+    position = df.columns.get_loc('Zone') + 1 if 'Zone' in df.columns else len(df.columns)
+    for offset, column in enumerate(quantities.columns):
+        df.insert(position + offset, column, df['GUID'].map(quantities[column]).astype('float64'))
+    return df
+
+
+def compact_extracted_frame(df: pd.DataFrame, source_file: str, extract_date: str) -> pd.DataFrame:
+    """
+    Compact dtypes of an extracted frame in place and attach constant metadata
+
+    CATEGORICAL_COLUMNS become categoricals (Gjenbruksstatus always has the
+    NY/EKS/GJEN categories, so the dashboard can assign them). The constant
+    source file name and extraction date are kept in df.attrs
+    ('source_file', 'extract_date') instead of being repeated on every row.
+    """
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns and df[col].dtype == object:
+            df[col] = df[col].astype('category')
+
+    status_col = 'G55_LCA.Gjenbruksstatus'
+    if status_col in df.columns:
+        missing = [v for v in GJENBRUKSSTATUS_VALUES if v not in df[status_col].cat.categories]
+        df[status_col] = df[status_col].cat.add_categories(missing)
+
+    df.attrs['source_file'] = source_file
+    df.attrs['extract_date'] = extract_date
+
+    logger.info(f"DataFrame memory: {frame_memory_mb(df):.1f} MB ({len(df)} rows × {len(df.columns)} columns)")
+    return df
+
+
+def frame_memory_mb(df: pd.DataFrame) -> float:
+    """Memory footprint of a DataFrame in MB, including Python string objects"""
+    return df.memory_usage(deep=True).sum() / 1024 / 1024
+
+
+def with_metadata_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Frame with _source_file/_extract_date columns restored from df.attrs
+
+    For exports (Excel) that should keep the per-row metadata columns.
+    Returns df unchanged if there is no metadata or the columns exist.
+    """
+    metadata = {'_source_file': df.attrs.get('source_file'), '_extract_date': df.attrs.get('extract_date')}
+    missing = {col: value for col, value in metadata.items() if value is not None and col not in df.columns}
+    return df.assign(**missing) if missing else df
+
+
+def write_excel_streaming(df: pd.DataFrame, target, sheet_name: str = 'Elements', chunk_size: int = 5000,
+                          column_width: float = 25):
+    """
+    Write df to an .xlsx file or binary buffer with constant memory
+
+    Uses openpyxl's write-only mode, which streams rows to disk instead of
+    keeping every cell object in memory. Column widths are set before the
+    first row (required in write-only mode); rows are converted chunk by
+    chunk, missing values become empty cells and non-scalar values (lists
+    from enumerated/list properties) strings, as with DataFrame.to_excel.
+    """
+    from openpyxl import Workbook
+    from openpyxl.utils import get_column_letter
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(sheet_name)
+    for position in range(1, len(df.columns) + 1):
+        worksheet.column_dimensions[get_column_letter(position)].width = column_width
+
+    worksheet.append([str(col) for col in df.columns])
+    for start in range(0, len(df), chunk_size):
+        chunk = df.iloc[start:start + chunk_size].astype(object)
+        chunk = chunk.where(chunk.notna(), None)
+        for col in chunk.columns[(df.dtypes == object).to_numpy()]:
+            chunk[col] = chunk[col].map(lambda value: str(value) if isinstance(value, (list, tuple, dict, set)) else value)
+        for row in chunk.itertuples(index=False, name=None):
+            worksheet.append(row)
+
+    workbook.save(target)
+
+
+def is_property_column(col) -> bool:
+    """True for "Pset.Prop" columns that are synced to the IFC (not _metadata or "<pset>.id")"""
+    return isinstance(col, str) and '.' in col and not col.startswith('_') and col.rsplit('.', 1)[1] != 'id'
+
+
+def excel_reader_engine() -> str:
+    """Fastest available pd.read_excel engine: 'calamine' if python-calamine is installed, else 'openpyxl'"""
+    try:
+        import python_calamine  # noqa: F401
+    except ImportError:
+        return 'openpyxl'
+    return 'calamine'
+
+
+def read_property_sheet(excel_path: Path, engine: str = None) -> pd.DataFrame:
+    """
+    Read only GUID and the "Pset.Prop" columns of an edited workbook
+
+    Element info, quantity and metadata columns are skipped while parsing
+    (usecols), and GUIDs are read as strings. Uses the calamine engine
+    (Rust, several times faster than openpyxl) when available and falls
+    back to openpyxl if the engine is missing or unsupported by pandas.
+
+    Args:
+        excel_path: Workbook to read (first sheet)
+        engine: pd.read_excel engine (default: excel_reader_engine())
+    """
+    engine = engine or excel_reader_engine()
+    options = {'usecols': lambda col: col == 'GUID' or is_property_column(col), 'dtype': {'GUID': str}}
+    if engine != 'openpyxl':
+        try:
+            return pd.read_excel(excel_path, engine=engine, **options)
+        except (ImportError, ValueError) as e:
+            logger.info(f"Excel engine {engine} unavailable ({e}), using openpyxl")
+    return pd.read_excel(excel_path, engine='openpyxl', **options)
+
+
+def make_parquet_safe(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Return a copy of df that Arrow/Parquet can store
+
+    Property columns mix numbers with "" for missing values, which Parquet
+    cannot hold in one column. Object columns with mixed or non-scalar value
+    types are converted to strings (missing values stay missing).
+    """
+    safe = df.copy()
+    for col in safe.columns[safe.dtypes == object]:
+        values = safe[col]
+        types = set(values.dropna().map(type).unique())
+        if len(types) > 1 or not types <= {str, int, float, bool}:
+            safe[col] = values.where(values.isna(), values.astype(str))
+    return safe
+
+
+class ExtractionCache:
+    """
+    Content-addressed disk cache for extracted DataFrames
+
+    Entries are Parquet files keyed by the SHA-256 of the IFC file plus
+    EXTRACTOR_VERSION. A (path, size, mtime) → hash index skips rehashing
+    files that have not changed. Least recently used entries are evicted
+    when the cache grows beyond max_bytes.
+
+    Output files derived from a cached extraction (the analysis IFC) are
+    recorded with their size and mtime, so they can be reused as long as
+    nobody has written to them since (see record_output/output_matches).
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int = 2 * 1024 ** 3):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._hash_index_path = self.cache_dir / "hash_index.json"
+        self._output_index_path = self.cache_dir / "output_index.json"
+
+    def _load_index(self, index_path: Path) -> dict:
+        try:
+            with open(index_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _temp_path(self, target: Path) -> Path:
+        """Unique temp file next to target (sessions run as threads and write concurrently)"""
+        self.cache_dir.mkdir(exist_ok=True, parents=True)
+        fd, tmp_name = tempfile.mkstemp(dir=self.cache_dir, prefix=f".{target.stem}.", suffix='.tmp')
+        os.close(fd)
+        return Path(tmp_name)
+
+    def _save_index(self, index_path: Path, index: dict):
+        tmp_path = self._temp_path(index_path)
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(index, f)
+            os.replace(tmp_path, index_path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    def file_hash(self, ifc_path: Path) -> str:
+        """SHA-256 of the file, reusing the stored hash if size and mtime are unchanged"""
+        stat = ifc_path.stat()
+        path_key = str(ifc_path.resolve())
+        hash_index = self._load_index(self._hash_index_path)
+
+        entry = hash_index.get(path_key)
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry['sha256']
+
+        digest = hashlib.sha256()
+        with open(ifc_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+
+        hash_index[path_key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+        self._save_index(self._hash_index_path, hash_index)
+        return digest.hexdigest()
+
+    def key_for(self, ifc_path: Path, **options) -> str:
+        """Cache key for an IFC file, extractor version and extraction options"""
+        return self.named_key(self.file_hash(ifc_path), **options)
+
+    def named_key(self, name: str, **options) -> str:
+        """Cache key for an entry not tied to one file (e.g. shared across revisions)"""
+        parts = [name, EXTRACTOR_VERSION]
+        parts += [f"{option}={options[option]!r}" for option in sorted(options)]
+        return hashlib.sha256("|".join(parts).encode('utf-8')).hexdigest()
+
+    def record_output(self, key: str, path: Path):
+        """Remember that path was just written from the data cached under key"""
+        stat = Path(path).stat()
+        output_index = self._load_index(self._output_index_path)
+        output_index[str(Path(path).resolve())] = {'key': key, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        self._save_index(self._output_index_path, output_index)
+
+    def output_matches(self, key: str, path: Path) -> bool:
+        """True if path was recorded for key and has not been written since"""
+        entry = self._load_index(self._output_index_path).get(str(Path(path).resolve()))
+        try:
+            stat = Path(path).stat()
+        except OSError:
+            return False
+        return (entry is not None and entry['key'] == key
+                and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns)
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        """Cached DataFrame for key, or None on a miss"""
+        entry_path = self.cache_dir / f"{key}.parquet"
+        if not entry_path.exists():
+            return None
+
+        try:
+            df = pd.read_parquet(entry_path)
+        except Exception as e:
+            logger.warning(f"Discarding unreadable cache entry {entry_path.name}: {e}")
+            entry_path.unlink(missing_ok=True)
+            return None
+
+        # Touch so LRU eviction sees this entry as recently used
+        os.utime(entry_path)
+        return df
+
+    def put(self, key: str, df: pd.DataFrame) -> bool:
+        """Store df under key and evict old entries. Returns False if it could not be written"""
+        entry_path = self.cache_dir / f"{key}.parquet"
+        tmp_path = self._temp_path(entry_path)
+
+        try:
+            make_parquet_safe(df).to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, entry_path)
+        except Exception as e:
+            logger.warning(f"Could not cache extraction: {e}")
+            tmp_path.unlink(missing_ok=True)
+            return False
+
+        self._evict()
+        return True
+
+    def _evict(self):
+        """Remove least recently used entries until total size fits max_bytes"""
+        # Another session may evict the same files concurrently
+        entries = []
+        for path in self.cache_dir.glob("*.parquet"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort(key=lambda entry: entry[0])
+        total = sum(size for _, size, _ in entries)
+        while entries and total > self.max_bytes:
+            _, size, oldest = entries.pop(0)
+            total -= size
+            oldest.unlink(missing_ok=True)
+            logger.info(f"Evicted cached extraction {oldest.name}")
+
+
+def write_ifc_atomic(ifc: ifcopenshell.file, path: Path, compresslevel: int = 6):
+    """
+    Write an IFC model to a temporary file next to path and rename it into place,
+    so readers (e.g. Solibri watching the file) never see a half-written file
+
+    A .ifczip path is written as an ifcZIP archive (deflate at compresslevel,
+    1 = fastest, 9 = smallest) holding one "<stem>.ifc" STEP file.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    step_path = path.with_name(f".{path.stem}.ifc.tmp")
+    try:
+        if path.suffix.lower() == '.ifczip':
+            ifc.write(str(step_path))
+            with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_DEFLATED,
+                                 compresslevel=compresslevel) as archive:
+                archive.write(step_path, arcname=f"{path.stem}.ifc")
+        else:
+            ifc.write(str(tmp_path))
+        os.replace(tmp_path, path)
+    finally:
+        for leftover in (tmp_path, step_path):
+            if leftover.exists():
+                leftover.unlink()
+
+
+def open_ifc(path: Path) -> ifcopenshell.file:
+    """Open an .ifc file or an ifcZIP archive (first .ifc member, unpacked to a temporary file)"""
+    path = Path(path)
+    if path.suffix.lower() != '.ifczip':
+        return ifcopenshell.open(str(path))
+
+    with zipfile.ZipFile(path) as archive:
+        member = next((name for name in archive.namelist() if name.lower().endswith('.ifc')), None)
+        if member is None:
+            raise ValueError(f"No .ifc file in {path.name}")
+        with tempfile.NamedTemporaryFile(suffix='.ifc', delete=False) as step_file:
+            with archive.open(member) as source:
+                shutil.copyfileobj(source, step_file)
+    try:
+        return ifcopenshell.open(step_file.name)
+    finally:
+        os.unlink(step_file.name)
+
+
+def normalise_cell(value):
+    """
+    Comparable form of a property value for change detection
+
+    Excel round-trips turn 12 into 12.0 and booleans into 1.0/0.0 or
+    True/False, while the IFC holds typed values, so numbers are compared
+    numerically (booleans as 1/0) and everything else as stripped strings.
+    Missing values stay missing.
+    """
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, (int, float)):
+        return str(int(value)) if float(value).is_integer() else repr(float(value))
+    text = str(value).strip()
+    if text.lower() in ('true', 'false'):
+        return '1' if text.lower() == 'true' else '0'
+    try:
+        number = float(text)
+    except ValueError:
+        return text
+    if number != number or number in (float('inf'), float('-inf')):
+        return text
+    return str(int(number)) if number.is_integer() else repr(number)
+
+
+def parse_bool(value) -> Optional[bool]:
+    """
+    Boolean for a sheet cell: true/false, yes/no, ja/nei, or a number
+    (non-zero is True, so Excel's 1.0 reads as True). None if not a boolean
+    """
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ('true', 'yes', 'ja'):
+        return True
+    if text in ('false', 'no', 'nei'):
+        return False
+    try:
+        number = float(text)
+    except ValueError:
+        return None
+    return None if number != number else number != 0
+
+
+class PropertyEntityIndex:
+    """
+    GUID → pset name → IfcPropertySet (and its IfcPropertySingleValue entities)
+
+    Built once per loaded analysis model from IfcRelDefinesByProperties and
+    IfcRelDefinesByType, so edits can set NominalValue directly instead of
+    calling get_psets and scanning element.IsDefinedBy for every change.
+    Property entities of a pset are indexed the first time that pset is used.
+    Psets shared by several elements (e.g. G55_Prosjektinfo) are copied on
+    write, so an edit only changes the element it was made for.
+    """
+
+    def __init__(self, ifc: ifcopenshell.file):
+        self.ifc = ifc
+        self._definitions = {}
+        self._relations = {}
+        self._users = {}
+        self._type_psets = {}
+        self._properties = {}
+        self._owner_history = next(iter(ifc.by_type("IfcOwnerHistory")), None)
+        self._build()
+
+    def _build(self):
+        for rel in self.ifc.by_type("IfcRelDefinesByProperties"):
+            definition = rel.RelatingPropertyDefinition
+            if not hasattr(definition, 'Name'):
+                continue
+            for obj in rel.RelatedObjects or []:
+                if not hasattr(obj, 'GlobalId'):
+                    continue
+                definitions = self._definitions.setdefault(obj.GlobalId, {})
+                if definition.Name not in definitions:
+                    definitions[definition.Name] = definition
+                    self._relations[(obj.GlobalId, definition.Name)] = rel
+                    self._users[definition.id()] = self._users.get(definition.id(), 0) + 1
+
+        for rel in self.ifc.by_type("IfcRelDefinesByType"):
+            type_psets = {d.Name: d for d in getattr(rel.RelatingType, 'HasPropertySets', None) or []}
+            if type_psets:
+                for obj in rel.RelatedObjects or []:
+                    self._type_psets[obj.GlobalId] = type_psets
+
+        logger.info(f"Indexed property sets for {len(self._definitions)} elements")
+
+    def get_pset(self, guid: str, pset_name: str) -> Optional[ifcopenshell.entity_instance]:
+        """Occurrence property set (or quantity set) named pset_name, or None"""
+        return self._definitions.get(guid, {}).get(pset_name)
+
+    def has_pset(self, guid: str, pset_name: str) -> bool:
+        """True if the element has pset_name, directly or inherited from its type"""
+        return pset_name in self._definitions.get(guid, {}) or pset_name in self._type_psets.get(guid, {})
+
+    def properties(self, pset: ifcopenshell.entity_instance) -> dict:
+        """Property name → IfcProperty for a property set (only single values are editable)"""
+        props = self._properties.get(pset.id())
+        if props is None:
+            props = {prop.Name: prop for prop in getattr(pset, 'HasProperties', None) or []}
+            self._properties[pset.id()] = props
+        return props
+
+    def values(self, pset_name: str, prop_name: str) -> dict:
+        """GUID → current value of pset_name.prop_name for every element that has the property"""
+        result = {}
+        for guid, definitions in self._definitions.items():
+            pset = definitions.get(pset_name)
+            if pset is None or not pset.is_a('IfcPropertySet'):
+                continue
+            prop = self.properties(pset).get(prop_name)
+            if prop is not None and prop.is_a('IfcPropertySingleValue'):
+                result[guid] = prop.NominalValue.wrappedValue if prop.NominalValue is not None else None
+        return result
+
+    def current_values(self, columns: list) -> tuple:
+        """
+        Current values for "Pset.Prop" columns in one pass over the index
+
+        Returns (DataFrame indexed by GUID with one column per requested column,
+        NaN where the element has no such occurrence property; dict of
+        column → GUIDs whose cell is read-only). Read-only cells are psets and
+        properties the element only has through its type (also when an
+        occurrence pset of the same name exists), quantity sets
+        (IfcElementQuantity) and properties other than IfcPropertySingleValue.
+        """
+        wanted = {}
+        for col in columns:
+            pset_name, prop_name = col.rsplit('.', 1)
+            wanted.setdefault(pset_name, []).append((prop_name, col))
+
+        records = {}
+        read_only = {}
+
+        def lock(guid, props):
+            for _, col in props:
+                read_only.setdefault(col, []).append(guid)
+
+        for guid, definitions in self._definitions.items():
+            for pset_name, props in wanted.items():
+                pset = definitions.get(pset_name)
+                type_pset = self._type_psets.get(guid, {}).get(pset_name)
+                if pset is None:
+                    if type_pset is not None:
+                        lock(guid, props)
+                    continue
+                if not pset.is_a('IfcPropertySet'):
+                    lock(guid, props)
+                    continue
+                entities = self.properties(pset)
+                type_entities = self.properties(type_pset) if type_pset is not None else {}
+                for prop_name, col in props:
+                    prop = entities.get(prop_name)
+                    if prop is None:
+                        # Shown in the sheet with the type's value; not copied onto the occurrence
+                        if prop_name in type_entities:
+                            read_only.setdefault(col, []).append(guid)
+                        continue
+                    if not prop.is_a('IfcPropertySingleValue'):
+                        read_only.setdefault(col, []).append(guid)
+                    elif prop.NominalValue is not None:
+                        records.setdefault(guid, {})[col] = prop.NominalValue.wrappedValue
+
+        # Elements without any occurrence pset can still inherit from their type
+        for guid, type_psets in self._type_psets.items():
+            if guid not in self._definitions:
+                for pset_name in wanted.keys() & type_psets.keys():
+                    lock(guid, wanted[pset_name])
+
+        current = pd.DataFrame.from_dict(records, orient='index', columns=columns)
+        return current, read_only
+
+    def set_value(self, guid: str, pset_name: str, prop_name: str, value) -> bool:
+        """
+        Set pset_name.prop_name on an element's occurrence pset
+
+        The value is cast to the existing property's IFC value type where
+        possible (IfcLabel otherwise); missing properties are added to the pset.
+        Returns False if the element has no editable pset with that name, the
+        property is not an IfcPropertySingleValue or a boolean property gets a
+        value that is not a boolean (see parse_bool). A pset shared with other
+        elements is first copied for this element (see _unshare).
+        """
+        pset = self.get_pset(guid, pset_name)
+        if pset is None or not pset.is_a('IfcPropertySet'):
+            return False
+
+        props = self.properties(pset)
+        prop = props.get(prop_name)
+        if prop is not None and not prop.is_a('IfcPropertySingleValue'):
+            return False
+
+        nominal_value = self._nominal_value(prop.NominalValue if prop is not None else None, value)
+        if nominal_value is None:
+            logger.warning(f"Not a boolean, {pset_name}.{prop_name} on {guid} left unchanged: {value!r}")
+            return False
+
+        if self._users.get(pset.id(), 1) > 1:
+            pset = self._unshare(guid, pset_name, pset)
+            props = self.properties(pset)
+            prop = props.get(prop_name)
+        if prop is not None:
+            prop.NominalValue = nominal_value
+        else:
+            prop = self.ifc.create_entity("IfcPropertySingleValue", Name=prop_name, NominalValue=nominal_value)
+            pset.HasProperties = list(pset.HasProperties or []) + [prop]
+            props[prop_name] = prop
+        return True
+
+    def add_pset(self, product: ifcopenshell.entity_instance, pset_name: str) -> ifcopenshell.entity_instance:
+        """Create an empty occurrence property set on product and index it"""
+        pset = self.ifc.create_entity("IfcPropertySet", GlobalId=ifcopenshell.guid.new(),
+                                      OwnerHistory=self._owner_history, Name=pset_name, HasProperties=[])
+        self.ifc.create_entity("IfcRelDefinesByProperties", GlobalId=ifcopenshell.guid.new(),
+                               OwnerHistory=self._owner_history, RelatedObjects=[product],
+                               RelatingPropertyDefinition=pset)
+        self._definitions.setdefault(product.GlobalId, {})[pset_name] = pset
+        self._users[pset.id()] = 1
+        return pset
+
+    def _unshare(self, guid: str, pset_name: str, pset: ifcopenshell.entity_instance) -> ifcopenshell.entity_instance:
+        """Move an element off a shared pset onto its own copy of it and return the copy"""
+        rel = self._relations[(guid, pset_name)]
+        copy = self.ifc.create_entity(
+            "IfcPropertySet", GlobalId=ifcopenshell.guid.new(), OwnerHistory=pset.OwnerHistory,
+            Name=pset.Name, Description=pset.Description,
+            HasProperties=[ifcopenshell.util.element.copy(self.ifc, prop) for prop in pset.HasProperties or []])
+
+        others = [obj for obj in rel.RelatedObjects if getattr(obj, 'GlobalId', None) != guid]
+        if others:
+            product = next(obj for obj in rel.RelatedObjects if getattr(obj, 'GlobalId', None) == guid)
+            rel.RelatedObjects = others
+            rel = self.ifc.create_entity("IfcRelDefinesByProperties", GlobalId=ifcopenshell.guid.new(),
+                                         OwnerHistory=self._owner_history, RelatedObjects=[product],
+                                         RelatingPropertyDefinition=copy)
+        else:
+            # The element's own relationship; another relationship shares the pset
+            rel.RelatingPropertyDefinition = copy
+
+        self._users[pset.id()] -= 1
+        self._users[copy.id()] = 1
+        self._relations[(guid, pset_name)] = rel
+        self._definitions[guid][pset_name] = copy
+        return copy
+
+    def _nominal_value(self, current: Optional[ifcopenshell.entity_instance], value) -> ifcopenshell.entity_instance:
+        """
+        IFC value entity for value, keeping the type of the current value if it can be cast
+
+        None for a boolean property when value is not a boolean; it is not
+        silently written as False.
+        """
+        if current is None:
+            return self.ifc.create_entity("IfcLabel", str(value))
+
+        kind = type(current.wrappedValue)
+        try:
+            if kind is bool:
+                cast = parse_bool(value)
+                if cast is None:
+                    return None
+            elif kind is int:
+                cast = int(float(value))
+            elif kind is float:
+                cast = float(value)
+            else:
+                cast = str(value)
+            return self.ifc.create_entity(current.is_a(), cast)
+        except (TypeError, ValueError):
+            return self.ifc.create_entity("IfcLabel", str(value))
+
+
+class IFCModelSession:
+    """
+    Shared handle to an opened IFC model
+
+    Lets several stages (extraction, analysis IFC creation, later updates)
+    work on one parsed model instead of each calling ifcopenshell.open on
+    the same file.
+
+    Lifecycle: open() → pass .ifc to the stages → write() → close(). Can also
+    be used as a context manager, which opens on enter and closes on exit.
+    is_stale() reports whether the file changed on disk since the session
+    last read or wrote it (e.g. replaced by another program).
+
+    Hold lock while editing the model if it may be written from another
+    thread (see WriteBehindWriter).
+    """
+
+    def __init__(self, ifc_path: Path):
+        self.path = Path(ifc_path)
+        self.ifc = None
+        self._disk_state = None
+        self.lock = threading.RLock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.ifc is not None
+
+    def _read_disk_state(self) -> tuple:
+        stat = self.path.stat()
+        return stat.st_size, stat.st_mtime_ns
+
+    def open(self) -> ifcopenshell.file:
+        """Parse the IFC file (no-op if already open)"""
+        if self.ifc is None:
+            logger.info(f"📂 Opening IFC: {self.path.name}")
+            self._disk_state = self._read_disk_state()
+            self.ifc = open_ifc(self.path)
+        return self.ifc
+
+    def write(self, path: Path = None):
+        """
+        Write the model to path (default: session path) and track that file from now on
+
+        The write is atomic (see write_ifc_atomic).
+        """
+        with self.lock:
+            if path is not None:
+                self.path = Path(path)
+            write_ifc_atomic(self.ifc, self.path)
+            self._disk_state = self._read_disk_state()
+
+    def rebind(self, path: Path):
+        """Track path, which was just written from this model by other code"""
+        self.path = Path(path)
+        self._disk_state = self._read_disk_state()
+
+    def is_stale(self) -> bool:
+        """True if the file on disk no longer matches what this session read or wrote"""
+        try:
+            return self._read_disk_state() != self._disk_state
+        except OSError:
+            return True
+
+    def close(self):
+        """Release the parsed model"""
+        self.ifc = None
+        self._disk_state = None
+
+    def __enter__(self) -> "IFCModelSession":
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+_live_writers = weakref.WeakSet()
+
+
+@atexit.register
+def _close_writers():
+    """Flush writers still alive at interpreter exit (weak refs, so sessions can end before)"""
+    for writer in list(_live_writers):
+        writer.close()
+
+
+class WriteBehindWriter:
+    """
+    Background writer that coalesces IFC saves
+
+    schedule() marks a session dirty and returns immediately. A daemon thread
+    writes dirty sessions at most once every interval_ms, so a burst of edits
+    becomes one write; it ends when nothing is pending, so an idle writer holds
+    no thread and is freed with its owner. Writes go through
+    IFCModelSession.write (atomic, under the session lock). flush() forces
+    pending writes and waits for them; wait_idle() only waits. last_error
+    holds the error of the most recent failed write until a later write
+    succeeds; callers must check it, since schedule() has long returned.
+    Pending writes are flushed at interpreter exit.
+    """
+
+    def __init__(self, interval_ms: int = 500):
+        self.interval = interval_ms / 1000
+        self.last_error = None
+        self._pending = {}
+        self._writing = False
+        self._flush_requested = False
+        self._closed = False
+        self._last_write = 0.0
+        self._cond = threading.Condition()
+        self._thread = None
+        _live_writers.add(self)
+
+    def schedule(self, session: IFCModelSession):
+        """Queue session for writing"""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("WriteBehindWriter is closed")
+            self._pending[id(session)] = session
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ifc-write-behind", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    @property
+    def has_pending(self) -> bool:
+        with self._cond:
+            return bool(self._pending) or self._writing
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._pending:
+                    # Idle: end the thread, schedule() starts a new one
+                    self._thread = None
+                    self._cond.notify_all()
+                    return
+
+                # Rate limit: wait out the interval since the last write unless flushing
+                while not self._flush_requested and not self._closed:
+                    remaining = self._last_write + self.interval - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                sessions = list(self._pending.values())
+                self._pending.clear()
+                self._flush_requested = False
+                self._writing = True
+
+            for session in sessions:
+                try:
+                    with session.lock:
+                        if session.is_open:
+                            session.write()
+                            logger.info(f"💾 Wrote {session.path.name} (write-behind)")
+                    self.last_error = None
+                except Exception as e:
+                    self.last_error = e
+                    logger.error(f"❌ Write-behind save failed for {session.path.name}: {e}")
+
+            with self._cond:
+                self._writing = False
+                self._last_write = time.monotonic()
+                self._cond.notify_all()
+
+    def wait_idle(self, timeout: float = None) -> bool:
+        """Wait until nothing is pending or being written. Returns False on timeout"""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._writing, timeout)
+
+    def flush(self, timeout: float = None) -> bool:
+        """Write pending sessions now and wait. Returns False on timeout"""
+        with self._cond:
+            if self._pending:
+                self._flush_requested = True
+                self._cond.notify_all()
+        return self.wait_idle(timeout)
+
+    def close(self, timeout: float = None):
+        """Flush pending writes and stop the thread"""
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+
+class ProgressReporter:
+    """
+    Time-throttled progress for long-running stages
+
+    Wraps a progress_callback(current, total, message) and forwards at most
+    max_hz updates per second, so callback cost (e.g. Streamlit re-rendering
+    st.progress) is bounded by wall time rather than model size. done/total
+    maps onto the stage's start..end percent range; messages include the
+    count, items/s and an ETA. The final item is always reported. With a
+    None callback update() does nothing, so stages can call it unconditionally.
+    """
+
+    def __init__(self, callback, total: int, label: str, start: int = 5, end: int = 85, max_hz: float = 10.0):
+        self.callback = callback
+        self.total = total
+        self.label = label
+        self.start = start
+        self.end = end
+        self.interval = 1 / max_hz
+        self._started = time.monotonic()
+        self._last = float('-inf')
+
+    def update(self, done: int):
+        """Report done of total items if the last report is at least 1/max_hz s old"""
+        if self.callback is None:
+            return
+        now = time.monotonic()
+        if now - self._last < self.interval and done < self.total:
+            return
+        self._last = now
+
+        fraction = min(done / self.total, 1.0) if self.total else 1.0
+        elapsed = now - self._started
+        message = f"{self.label}... ({done}/{self.total}"
+        if done and elapsed > 0:
+            rate = done / elapsed
+            message += f", {rate:.0f}/s, ca. {max(self.total - done, 0) / rate:.0f} s igjen"
+        self.callback(int(self.start + fraction * (self.end - self.start)), 100, message + ")")
+
+
+# Per-process state for parallel extraction workers (set by _init_shard_worker)
+_shard_state = {}
+
+
+def _init_shard_worker(ifc_path: str, use_index: bool, input_folder: str, output_folder: str,
+                       include_types: tuple = LCA_ENTITY_TYPES, exclude_types: tuple = None):
+    """Process pool initializer: open the IFC and build the index once per worker"""
+    ifc = ifcopenshell.open(ifc_path)
+    _shard_state['ifc'] = ifc
+    _shard_state['products'] = select_products(ifc, include_types, exclude_types)
+    _shard_state['index'] = IFCRelationshipIndex(ifc) if use_index else None
+    _shard_state['sync'] = SimpleIFCSync(input_folder=input_folder, output_folder=output_folder)
+
+
+def _extract_shard_quantities() -> pd.DataFrame:
+    """Quantity pass over the worker's model (runs alongside the row shards)"""
+    return extract_quantities(_shard_state['ifc'])
+
+
+def _extract_shard(shard: int, num_shards: int) -> list:
+    """Extract every num_shards-th product starting at shard, as (position, row) pairs"""
+    sync = _shard_state['sync']
+    products = _shard_state['products']
+    index = _shard_state['index']
+
+    rows = []
+    for position in range(shard, len(products), num_shards):
+        product = products[position]
+        try:
+            rows.append((position, sync._extract_row(product, index)))
+        except Exception as e:
+            logger.warning(f"Error processing {product.GlobalId}: {e}")
+    return rows
+
 
 class SimpleIFCSync:
     """Simplified IFC-Excel sync for proof of concept"""
 
-    def __init__(self, input_folder: str = "input", output_folder: str = "output", use_temp: bool = False):
+    def __init__(self, input_folder: str = "input", output_folder: str = "output", use_temp: bool = False,
+                 write_behind_ms: int = 0):
         """
         Initialize with input/output folders
 
@@ -34,6 +1356,9 @@ class SimpleIFCSync:
             input_folder: Folder for input IFC files
             output_folder: Folder for output files (Excel, analysis IFC)
             use_temp: If True, use temporary directory (for Streamlit Cloud)
+            write_behind_ms: If > 0, analysis IFC updates are saved by a background
+                thread at most this often (call flush_writes() before reading the file).
+                0 saves synchronously in each update call
         """
         if use_temp:
             import tempfile
@@ -52,25 +1377,60 @@ class SimpleIFCSync:
         self.input_folder.mkdir(exist_ok=True, parents=True)
         self.output_folder.mkdir(exist_ok=True, parents=True)
 
+        # Extracted DataFrames keyed by IFC content hash (see run_workflow)
+        self.extract_cache = ExtractionCache(self.output_folder / "extract_cache")
+
+        # Analysis model kept in memory between edits (see open_analysis_model)
+        self.analysis_session = None
+        # Pset entity index and Gjenbruksstatus per GUID for the resident model
+        self._property_index = None
+        self._persisted_status = None
+        self.last_updated_count = 0
+
+        # Property name → matches BIM_ID_PROPERTY_MARKERS (see get_bim_id)
+        self._bim_id_names = {}
+
+        # Background saving of the analysis IFC (see save_analysis_model)
+        self.writer = WriteBehindWriter(write_behind_ms) if write_behind_ms > 0 else None
+
         logger.info(f"Input folder: {self.input_folder}")
         logger.info(f"Output folder: {self.output_folder}")
         if use_temp:
             logger.info(f"Using temporary directory (cloud mode)")
 
-    def get_bim_id(self, element: ifcopenshell.entity_instance) -> Optional[str]:
-        """Extract BIM authoring tool ID (e.g., Revit Element ID)"""
-        if hasattr(element, 'Tag') and element.Tag:
-            return str(element.Tag)
+    def get_bim_id(self, element: ifcopenshell.entity_instance, psets: dict = None) -> Optional[str]:
+        """
+        Extract BIM authoring tool ID (e.g., Revit Element ID)
 
-        psets = ifcopenshell.util.element.get_psets(element)
-        for pset_name, props in psets.items():
+        Tag is used if set. Otherwise the first non-empty property whose name
+        contains ELEMENTID/REVITID/BATID; whether a name matches is computed
+        once per property name, so later elements only do dict lookups.
+
+        Args:
+            element: IFC element
+            psets: Optional psets already fetched for the element (avoids a second get_psets)
+        """
+        tag = getattr(element, 'Tag', None)
+        if tag:
+            return str(tag)
+
+        if psets is None:
+            psets = ifcopenshell.util.element.get_psets(element)
+        id_names = self._bim_id_names
+        for props in psets.values():
             for prop_name, value in props.items():
-                if any(id_name in prop_name.upper() for id_name in ['ELEMENTID', 'REVITID', 'BATID']):
-                    if value:
-                        return str(value)
+                matched = id_names.get(prop_name)
+                if matched is None:
+                    upper = prop_name.upper()
+                    matched = id_names[prop_name] = any(marker in upper for marker in BIM_ID_PROPERTY_MARKERS)
+                if matched and value:
+                    return str(value)
         return None
 
-    def extract_ifc_to_excel(self, ifc_path: Path, progress_callback=None) -> pd.DataFrame:
+    def extract_ifc_to_excel(self, ifc_path: Path, progress_callback=None, use_index: bool = True,
+                             workers: int = 1, ifc: ifcopenshell.file = None,
+                             index: IFCRelationshipIndex = None, include_types: tuple = LCA_ENTITY_TYPES,
+                             exclude_types: tuple = None) -> pd.DataFrame:
         """
         Extract IFC elements to Excel DataFrame
 
@@ -78,20 +1438,302 @@ class SimpleIFCSync:
         - GUID (External ID for Solibri)
         - BIM_ID (Element ID from authoring tool)
         - Entity type
-        - Name, Type, Material
+        - Name, Type, Material, Floor, Zone
+        - Volume_m3, Area_m2, Length_m, Weight_kg: float quantities in SI units
+          from IfcElementQuantity (see extract_quantities)
         - All properties from custom property sets
 
+        Repeated strings (Entity, Material, ...) are categoricals; source file
+        and extraction date are in df.attrs (see compact_extracted_frame).
+
         Args:
             ifc_path: Path to IFC file
             progress_callback: Optional callback function(current, total, message)
+            use_index: If True, resolve storey/zone/material/psets through a
+                one-pass IFCRelationshipIndex instead of per-element traversal
+            workers: Number of worker processes. Above 1, products are split into
+                shards extracted in parallel; output matches the serial path
+            ifc: Already opened model for ifc_path (e.g. IFCModelSession.ifc),
+                skips parsing the file again. Ignored when workers > 1
+            index: Already built IFCRelationshipIndex for ifc, so a caller can
+                reuse it (e.g. for content_hashes). Ignored when workers > 1
+            include_types: Entity types to extract, subtypes included (None = every
+                IfcProduct); see select_products
+            exclude_types: Entity types to skip
         """
         logger.info(f"📖 Extracting IFC: {ifc_path.name}")
 
+        if workers > 1:
+            data, quantities = self._extract_rows_parallel(ifc_path, workers, use_index, progress_callback,
+                                                           include_types, exclude_types)
+        else:
+            if ifc is None:
+                if progress_callback:
+                    progress_callback(0, 100, "Åpner IFC-fil...")
+                ifc = ifcopenshell.open(str(ifc_path))
+            data = list(self.iter_rows(ifc_path, progress_callback, use_index=use_index, ifc=ifc, index=index,
+                                       include_types=include_types, exclude_types=exclude_types))
+            quantities = extract_quantities(ifc)
+
         if progress_callback:
-            progress_callback(0, 100, "Åpner IFC-fil...")
+            progress_callback(85, 100, "Oppretter DataFrame...")
 
-        ifc = ifcopenshell.open(str(ifc_path))
-        products = ifc.by_type("IfcProduct")
+        df = pd.DataFrame(data)
+        insert_quantity_columns(df, quantities)
+
+        # Compact dtypes; source file and date are frame metadata (df.attrs)
+        compact_extracted_frame(df, ifc_path.name, datetime.now().isoformat())
+
+        logger.info(f"✅ Extracted {len(df)} elements")
+
+        if progress_callback:
+            progress_callback(90, 100, f"Ferdig! Ekstrahert {len(df)} elementer")
+
+        return df
+
+    def extract_material_layers(self, ifc_path: Path, ifc: ifcopenshell.file = None,
+                                use_cache: bool = True) -> pd.DataFrame:
+        """
+        Material child table: one row per element × material layer/constituent
+
+        Complements the one-row-per-element extraction (where Material joins
+        all names with " | ") so volume can be attributed per material, see
+        material_volumes(). Join on GUID.
+
+        Columns: GUID and Material (categoricals), Layer (position in the set),
+        Thickness_m (layer sets only) and Fraction (volume share, sums to 1
+        per element).
+
+        Args:
+            ifc_path: Path to IFC file
+            ifc: Already opened model for ifc_path, skips parsing the file again
+            use_cache: Reuse the table extracted earlier for the same file content
+        """
+        cache_key = None
+        if use_cache:
+            cache_key = self.extract_cache.key_for(ifc_path, stage='material_layers')
+            cached = self.extract_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        if ifc is None:
+            ifc = ifcopenshell.open(str(ifc_path))
+
+        length_scale = quantity_unit_scales(ifc)['Length_m']
+        rows_cache = {}
+        guids, positions, names, thicknesses, fractions = [], [], [], [], []
+        for guid, material in product_material_selects(ifc).items():
+            rows = rows_cache.get(material.id())
+            if rows is None:
+                rows = rows_cache[material.id()] = material_layer_rows(material, length_scale)
+            for position, (name, thickness, fraction) in enumerate(rows):
+                guids.append(guid)
+                positions.append(position)
+                names.append(name)
+                thicknesses.append(thickness)
+                fractions.append(fraction)
+
+        layers = pd.DataFrame({
+            'GUID': pd.Categorical(guids),
+            'Layer': pd.Series(positions, dtype='int16'),
+            'Material': pd.Categorical(names),
+            'Thickness_m': pd.Series(thicknesses, dtype='float64'),
+            'Fraction': pd.Series(fractions, dtype='float64'),
+        })
+        logger.info(f"Extracted {len(layers)} material layers for {layers['GUID'].nunique()} elements")
+
+        if use_cache:
+            self.extract_cache.put(cache_key, layers)
+        return layers
+
+    def content_hashes(self, ifc_path: Path, ifc: ifcopenshell.file = None, index: IFCRelationshipIndex = None,
+                       use_cache: bool = True, include_types: tuple = LCA_ENTITY_TYPES,
+                       exclude_types: tuple = None) -> pd.Series:
+        """
+        Content hash per selected element GUID (see IFCRelationshipIndex.content_hash)
+
+        Cached per IFC content hash and filters, so the previous revision's
+        hashes are available without parsing it again. run_workflow stores
+        them with every serial extraction and extract_incremental for the new
+        revision. With the index used for extraction the psets are already
+        read, so hashing adds little.
+
+        Args:
+            ifc_path: Path to IFC file
+            ifc: Already opened model for ifc_path, skips parsing the file again
+            index: Already built IFCRelationshipIndex for ifc (its pset cache is
+                reused); pass ifc with it
+            use_cache: Read/store the hashes in the extraction cache
+            include_types: Entity types to hash, subtypes included (None = every
+                IfcProduct); see select_products
+            exclude_types: Entity types to skip
+        """
+        cache_key = None
+        if use_cache:
+            cache_key = self.extract_cache.key_for(ifc_path, stage='content_hashes',
+                                                   include_types=include_types, exclude_types=exclude_types)
+            cached = self.extract_cache.get(cache_key)
+            if cached is not None:
+                return cached.set_index('GUID')['Hash']
+
+        if ifc is None:
+            ifc = ifcopenshell.open(str(ifc_path))
+        if index is None:
+            index = IFCRelationshipIndex(ifc)
+        products = select_products(ifc, include_types, exclude_types)
+
+        hashes = pd.DataFrame({
+            'GUID': [product.GlobalId for product in products],
+            'Hash': [index.content_hash(product) for product in products],
+        }).drop_duplicates('GUID')
+
+        if use_cache:
+            self.extract_cache.put(cache_key, hashes)
+        return hashes.set_index('GUID')['Hash']
+
+    def extract_incremental(self, ifc_path: Path, previous_ifc_path: Path, previous_df: pd.DataFrame = None,
+                            progress_callback=None, ifc: ifcopenshell.file = None,
+                            include_types: tuple = LCA_ENTITY_TYPES, exclude_types: tuple = None) -> tuple:
+        """
+        Extract a new revision reusing the extraction of the previous one
+
+        Elements whose GUID and content hash (see content_hashes) match the
+        previous revision keep their previous row; changed and added elements
+        are extracted, removed GUIDs are dropped. G55_LCA.Gjenbruksstatus
+        decisions carry over by GUID (from previous_df if given, else from the
+        previous extraction), also for changed elements.
+
+        Args:
+            ifc_path: Path to the new revision
+            previous_ifc_path: Path to the previous revision (its extraction and
+                hashes are read from the cache; the file is parsed only if not cached)
+            previous_df: Current DataFrame of the previous revision holding the
+                user's Gjenbruksstatus decisions
+            progress_callback: Optional callback function(current, total, message)
+            ifc: Already opened model for ifc_path, skips parsing the file again
+            include_types: Entity types to extract, subtypes included (None = every
+                IfcProduct); see select_products
+            exclude_types: Entity types to skip
+
+        Returns (DataFrame, summary) where summary counts unchanged, changed,
+        added and removed elements
+        """
+        logger.info(f"📖 Incremental extraction: {previous_ifc_path.name} → {ifc_path.name}")
+
+        previous = None
+        if previous_ifc_path.exists():
+            previous = self.extract_cache.get(self.extract_cache.key_for(
+                previous_ifc_path, include_types=include_types, exclude_types=exclude_types))
+        if previous is None:
+            previous = previous_df
+        if previous is None:
+            logger.info("No previous extraction available - extracting everything")
+            df = self.extract_ifc_to_excel(ifc_path, progress_callback, ifc=ifc,
+                                           include_types=include_types, exclude_types=exclude_types)
+            return df, {'unchanged': 0, 'changed': 0, 'added': len(df), 'removed': 0}
+
+        if ifc is None:
+            if progress_callback:
+                progress_callback(0, 100, "Åpner IFC-fil...")
+            ifc = ifcopenshell.open(str(ifc_path))
+
+        if progress_callback:
+            progress_callback(5, 100, "Sammenligner med forrige revisjon...")
+
+        index = IFCRelationshipIndex(ifc)
+        filters = {'include_types': include_types, 'exclude_types': exclude_types}
+        new_hashes = self.content_hashes(ifc_path, ifc=ifc, index=index, **filters)
+        # Stored by the previous run, so the previous file is normally not parsed.
+        # Without the file every element counts as changed (decisions still carry over)
+        old_hashes = (self.content_hashes(previous_ifc_path, **filters) if previous_ifc_path.exists()
+                      else pd.Series(dtype=object))
+
+        products = select_products(ifc, include_types, exclude_types)
+        selected = new_hashes.reindex([product.GlobalId for product in products]).dropna()
+        selected = selected[~selected.index.duplicated()]
+
+        previous = previous.drop_duplicates('GUID')
+        previous_guids = set(previous['GUID'].astype(str))
+        same_hash = selected.eq(old_hashes.reindex(selected.index))
+        unchanged = {guid for guid in selected.index[same_hash] if guid in previous_guids}
+
+        reporter = ProgressReporter(progress_callback, len(products), "Ekstraherer endrede elementer", start=10)
+        rows = []
+        for idx, product in enumerate(products):
+            reporter.update(idx + 1)
+            if product.GlobalId in unchanged:
+                continue
+            try:
+                rows.append(self._extract_row(product, index))
+            except Exception as e:
+                logger.warning(f"Error processing {product.GlobalId}: {e}")
+
+        extracted = pd.DataFrame(rows)
+        if len(extracted):
+            insert_quantity_columns(extracted, extract_quantities(ifc))
+
+        kept = previous[previous['GUID'].astype(str).isin(unchanged)]
+        # Empty frames and all-NA columns are left out of the concat (pandas deprecates
+        # them deciding the result dtype); the full column set is restored after
+        columns = list(dict.fromkeys(list(kept.columns) + list(extracted.columns)))
+        frames = [frame.dropna(axis=1, how='all') for frame in (kept, extracted) if len(frame)]
+        df = (pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()).reindex(columns=columns)
+
+        # Keep the new revision's element order
+        order = {product.GlobalId: position for position, product in enumerate(products)}
+        df = df.iloc[df['GUID'].astype(str).map(order).argsort(kind='stable').to_numpy()].reset_index(drop=True)
+
+        status_col = 'G55_LCA.Gjenbruksstatus'
+        decisions = previous_df if previous_df is not None and status_col in previous_df.columns else previous
+        if status_col in decisions.columns:
+            latest = decisions.drop_duplicates('GUID', keep='last')
+            statuses = pd.Series(latest[status_col].astype(object).to_numpy(), index=latest['GUID'].astype(str))
+            carried = df['GUID'].astype(str).map(statuses)
+            current = df[status_col].astype(object) if status_col in df.columns else None
+            df[status_col] = carried if current is None else carried.where(carried.notna(), current)
+
+        compact_extracted_frame(df, ifc_path.name, datetime.now().isoformat())
+
+        extracted_guids = set(extracted['GUID']) if len(extracted) else set()
+        summary = {
+            'unchanged': len(kept),
+            'changed': len(extracted_guids & previous_guids),
+            'added': len(extracted_guids - previous_guids),
+            'removed': len(previous_guids - set(selected.index)),
+        }
+        logger.info(f"✅ Incremental extraction: {summary}")
+
+        if progress_callback:
+            progress_callback(90, 100, f"Ferdig! {summary['changed'] + summary['added']} nye/endrede elementer")
+
+        return df, summary
+
+    def iter_rows(self, ifc_path: Path, progress_callback=None, use_index: bool = True,
+                  ifc: ifcopenshell.file = None, index: IFCRelationshipIndex = None,
+                  include_types: tuple = LCA_ENTITY_TYPES, exclude_types: tuple = None):
+        """
+        Yield extraction rows (dicts, same as extract_ifc_to_excel rows) one product at a time
+
+        Lets consumers start before the whole model is processed. The file is
+        opened and indexed when iteration starts. Products that fail are
+        logged and skipped.
+
+        Args:
+            ifc_path: Path to IFC file
+            progress_callback: Optional callback function(current, total, message)
+            use_index: Resolve relationships through a one-pass IFCRelationshipIndex
+            ifc: Already opened model for ifc_path, skips parsing the file again
+            index: Already built IFCRelationshipIndex for ifc (implies use_index)
+            include_types: Entity types to extract, subtypes included (None = every
+                IfcProduct); see select_products
+            exclude_types: Entity types to skip
+        """
+        if ifc is None:
+            if progress_callback:
+                progress_callback(0, 100, "Åpner IFC-fil...")
+            ifc = ifcopenshell.open(str(ifc_path))
+
+        products = select_products(ifc, include_types, exclude_types)
         total_products = len(products)
 
         logger.info(f"Found {total_products} products")
@@ -99,95 +1741,310 @@ class SimpleIFCSync:
         if progress_callback:
             progress_callback(5, 100, f"Fant {total_products} elementer...")
 
-        # Spatial container elements that don't have ContainedInStructure relationship
-        spatial_elements = ('IfcSite', 'IfcBuilding', 'IfcBuildingStorey', 'IfcSpace', 'IfcZone')
+        if index is None and use_index:
+            index = IFCRelationshipIndex(ifc)
+
+        reporter = ProgressReporter(progress_callback, total_products, "Ekstraherer elementer")
 
-        data = []
         for idx, product in enumerate(products):
             try:
-                # Basic element info
-                row = {
-                    'GUID': product.GlobalId,
-                    'BIM_ID': self.get_bim_id(product),
-                    'Entity': product.is_a(),
-                    'Name': product.Name if hasattr(product, 'Name') else None,
-                    'Type': product.ObjectType if hasattr(product, 'ObjectType') else None,
-                }
-
-                # Material extraction
-                materials = ifcopenshell.util.element.get_materials(product)
-                if materials:
-                    material_names = [mat.Name for mat in materials if hasattr(mat, 'Name')]
-                    row['Material'] = ' | '.join(material_names) if material_names else None
-                else:
-                    row['Material'] = None
-
-                # Extract Floor/Storey information (skip for spatial container elements)
-                row['Floor'] = None
-                if not product.is_a() in spatial_elements:
-                    if hasattr(product, 'ContainedInStructure'):
-                        for rel in product.ContainedInStructure:
-                            if rel.is_a('IfcRelContainedInSpatialStructure'):
-                                relating_structure = rel.RelatingStructure
-                                if relating_structure.is_a('IfcBuildingStorey'):
-                                    row['Floor'] = relating_structure.Name if hasattr(relating_structure, 'Name') else relating_structure.LongName
-                                    break
-
-                # Extract Zone/Space information
-                row['Zone'] = None
-                if hasattr(product, 'HasAssignments'):
-                    for rel in product.HasAssignments:
-                        if rel.is_a('IfcRelAssignsToGroup'):
-                            relating_group = rel.RelatingGroup
-                            if relating_group.is_a('IfcZone'):
-                                row['Zone'] = relating_group.Name if hasattr(relating_group, 'Name') else None
-                                break
-
-                # Also check if element is in a space (skip for spatial container elements)
-                if not row['Zone'] and not product.is_a() in spatial_elements:
-                    if hasattr(product, 'ContainedInStructure'):
-                        for rel in product.ContainedInStructure:
-                            if rel.is_a('IfcRelContainedInSpatialStructure'):
-                                relating_structure = rel.RelatingStructure
-                                if relating_structure.is_a('IfcSpace'):
-                                    row['Zone'] = relating_structure.Name if hasattr(relating_structure, 'Name') else relating_structure.LongName
-                                    break
-
-                # Extract all property sets
-                psets = ifcopenshell.util.element.get_psets(product)
-                for pset_name, props in psets.items():
-                    for prop_name, value in props.items():
-                        col_name = f"{pset_name}.{prop_name}"
-                        row[col_name] = value if value is not None else ""
-
-                data.append(row)
-
-                # Report progress every 10% or every 100 items
-                if progress_callback and (idx % max(1, total_products // 10) == 0 or idx % 100 == 0):
-                    progress = int(5 + (idx / total_products * 80))
-                    progress_callback(progress, 100, f"Ekstraherer elementer... ({idx}/{total_products})")
-
+                row = self._extract_row(product, index)
             except Exception as e:
                 logger.warning(f"Error processing {product.GlobalId}: {e}")
                 continue
 
-        if progress_callback:
-            progress_callback(85, 100, "Oppretter DataFrame...")
+            reporter.update(idx + 1)
 
-        df = pd.DataFrame(data)
+            yield row
 
-        # Add metadata
-        df['_source_file'] = ifc_path.name
-        df['_extract_date'] = datetime.now().isoformat()
+    def iter_batches(self, ifc_path: Path, batch_size: int = 1000, progress_callback=None,
+                     ifc: ifcopenshell.file = None, as_arrow: bool = False,
+                     include_types: tuple = LCA_ENTITY_TYPES, exclude_types: tuple = None):
+        """
+        Yield extraction results in batches of at most batch_size elements
 
-        logger.info(f"✅ Extracted {len(df)} elements")
+        Memory stays bounded by the batch size, so writers and previews can
+        consume a large model incrementally. Each batch only has the
+        "Pset.Prop" columns its elements use, so columns differ between
+        batches; dtypes are not compacted (see compact_extracted_frame).
+
+        Args:
+            ifc_path: Path to IFC file
+            batch_size: Maximum number of elements per batch
+            progress_callback: Optional callback function(current, total, message)
+            ifc: Already opened model for ifc_path, skips parsing the file again
+            as_arrow: Yield pyarrow.RecordBatch instead of pandas DataFrames
+                (mixed-type columns as strings, see make_parquet_safe)
+            include_types: Entity types to extract, subtypes included (None = every
+                IfcProduct); see select_products
+            exclude_types: Entity types to skip
+        """
+        if as_arrow:
+            import pyarrow  # noqa: F401 - fail before parsing the model if missing
+
+        batch = []
+        for row in self.iter_rows(ifc_path, progress_callback, ifc=ifc,
+                                  include_types=include_types, exclude_types=exclude_types):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield self._make_batch(batch, ifc_path, as_arrow)
+                batch = []
+        if batch:
+            yield self._make_batch(batch, ifc_path, as_arrow)
+
+    def _make_batch(self, rows: list, ifc_path: Path, as_arrow: bool):
+        df = pd.DataFrame(rows)
+        df.attrs['source_file'] = ifc_path.name
+        if as_arrow:
+            import pyarrow as pa
+            return pa.RecordBatch.from_pandas(make_parquet_safe(df), preserve_index=False)
+        return df
 
+    def compute_geometry_volumes(self, ifc_path: Path, ifc: ifcopenshell.file = None, threads: int = None,
+                                 progress_callback=None, use_cache: bool = True,
+                                 include_types: tuple = LCA_ENTITY_TYPES, exclude_types: tuple = None) -> pd.Series:
+        """
+        Element volumes (m³) computed from tessellated geometry
+
+        Optional extraction stage for models without volume properties.
+        Shapes are produced by ifcopenshell.geom.iterator on several threads,
+        for the selected products only. Volumes are cached per geometry hash
+        (see geometry_hash) across files, so a new revision only tessellates
+        elements whose geometry changed, and elements sharing a representation
+        are measured once. The GUID → volume result is also cached per IFC
+        content hash, which answers a repeated run without parsing the file.
+
+        Args:
+            ifc_path: Path to IFC file
+            ifc: Already opened model for ifc_path, skips parsing the file again
+            threads: Tessellation threads (default: all CPU cores)
+            progress_callback: Optional callback function(current, total, message)
+            use_cache: Reuse volumes computed earlier for the same file content or geometry
+            include_types: Entity types to measure, subtypes included (None = every
+                IfcProduct); see select_products
+            exclude_types: Entity types to skip
+
+        Returns:
+            Series of volumes indexed by GUID (elements without geometry are absent,
+            NaN where the volume could not be computed)
+        """
+        cache_key = None
+        if use_cache:
+            cache_key = self.extract_cache.key_for(ifc_path, stage='geometry_volumes',
+                                                   include_types=include_types, exclude_types=exclude_types)
+            cached = self.extract_cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"⚡ Loaded {len(cached)} geometry volumes from cache")
+                return cached.set_index('GUID')['Volume_m3']
+
+        import ifcopenshell.geom
+        import ifcopenshell.util.shape
+
+        if ifc is None:
+            ifc = ifcopenshell.open(str(ifc_path))
+
+        products = [product for product in select_products(ifc, include_types, exclude_types)
+                    if product.Representation is not None]
+        length_scale = quantity_unit_scales(ifc)['Length_m']
+        memo = {}
+        hash_by_guid = {product.GlobalId: geometry_hash(product, memo, length_scale) for product in products}
+
+        known_key = self.extract_cache.named_key('geometry_volumes_by_hash')
+        known = self.extract_cache.get(known_key) if use_cache else None
+        volume_by_hash = dict(zip(known['Geometry_Hash'], known['Volume_m3'])) if known is not None else {}
+        todo = [product for product in products if hash_by_guid[product.GlobalId] not in volume_by_hash]
+
+        threads = threads or os.cpu_count() or 1
+        logger.info(f"📐 Computing geometry volumes for {len(todo)} of {len(products)} elements ({threads} threads)")
         if progress_callback:
-            progress_callback(90, 100, f"Ferdig! Ekstrahert {len(df)} elementer")
+            progress_callback(0, 100, "Beregner volum fra geometri...")
+
+        computed = 0
+        if todo:
+            settings = ifcopenshell.geom.settings()
+            iterator = ifcopenshell.geom.iterator(settings, ifc, threads, include=todo)
+            reporter = ProgressReporter(progress_callback, len(todo), "Beregner volum", start=0, end=100)
+            if iterator.initialize():
+                while True:
+                    shape = iterator.get()
+                    geometry_key = hash_by_guid.get(shape.guid)
+                    if geometry_key is not None and geometry_key not in volume_by_hash:
+                        try:
+                            volume_by_hash[geometry_key] = abs(ifcopenshell.util.shape.get_volume(shape.geometry))
+                        except Exception as e:
+                            logger.warning(f"Could not compute volume for {shape.guid}: {e}")
+                            volume_by_hash[geometry_key] = float('nan')
+
+                    computed += 1
+                    reporter.update(computed)
+
+                    if not iterator.next():
+                        break
+
+        # Elements the iterator produced no shape for are absent
+        result = pd.DataFrame({'GUID': list(hash_by_guid), 'Geometry_Hash': list(hash_by_guid.values())})
+        result = result[result['Geometry_Hash'].isin(volume_by_hash.keys())].copy()
+        result['Volume_m3'] = result['Geometry_Hash'].map(volume_by_hash)
+        logger.info(f"✅ {len(result)} volumes, {computed} elements tessellated")
+
+        if use_cache:
+            if computed:
+                self.extract_cache.put(known_key, pd.DataFrame({'Geometry_Hash': list(volume_by_hash),
+                                                                'Volume_m3': list(volume_by_hash.values())}))
+            self.extract_cache.put(cache_key, result)
+
+        return result.set_index('GUID')['Volume_m3']
+
+    def _extract_rows_parallel(self, ifc_path: Path, workers: int, use_index: bool, progress_callback=None,
+                               include_types: tuple = LCA_ENTITY_TYPES, exclude_types: tuple = None) -> tuple:
+        """
+        Extract rows and quantities in worker processes
 
-        return df
+        Each worker opens the IFC once (pool initializer). Products are split
+        into strided shards (every n-th product) so similar elements, which are
+        usually clustered in the file, spread evenly over workers. Rows carry
+        their original position and are returned in serial order, together
+        with the extract_quantities frame computed by one of the workers.
+        """
+        num_shards = workers * 4
+        logger.info(f"Extracting with {workers} worker processes ({num_shards} shards)")
+
+        if progress_callback:
+            progress_callback(0, 100, f"Åpner IFC-fil i {workers} prosesser...")
+
+        positioned = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_shard_worker,
+                                 initargs=(str(ifc_path), use_index, str(self.input_folder), str(self.output_folder),
+                                           include_types, exclude_types)) as pool:
+            quantities_future = pool.submit(_extract_shard_quantities)
+            futures = [pool.submit(_extract_shard, shard, num_shards) for shard in range(num_shards)]
+            reporter = ProgressReporter(progress_callback, num_shards, "Ekstraherer elementer (deler)")
+            for done, future in enumerate(as_completed(futures), start=1):
+                positioned.extend(future.result())
+                reporter.update(done)
+
+            quantities = quantities_future.result()
+
+        positioned.sort(key=lambda item: item[0])
+        return [row for _, row in positioned], quantities
+
+    def _extract_row(self, product: ifcopenshell.entity_instance, index: "IFCRelationshipIndex" = None) -> dict:
+        """Build one wide extraction row for a product (element info plus "Pset.Prop" columns)"""
+        row, psets = self._extract_element(product, index)
+
+        # Flatten all property sets
+        for pset_name, props in psets.items():
+            for prop_name, value in props.items():
+                col_name = f"{pset_name}.{prop_name}"
+                row[col_name] = value if value is not None else ""
+
+        return row
+
+    def _extract_element(self, product: ifcopenshell.entity_instance, index: "IFCRelationshipIndex" = None) -> tuple:
+        """
+        Element info row and property sets for a product
+
+        With an index, storey/zone/material/psets are dictionary lookups.
+        Without one, they are resolved by walking the element's inverse
+        relationships (original per-element path, kept for benchmarking).
+        """
+        entity = product.is_a()
+        is_spatial = entity in SPATIAL_ELEMENTS
+
+        if index is not None:
+            guid = product.GlobalId
+            psets = index.get_psets(product)
+            material_names = index.materials.get(guid)
+            floor = None if is_spatial else index.storeys.get(guid)
+            zone = index.zones.get(guid)
+            if not zone and not is_spatial and guid in index.spaces:
+                zone = index.spaces[guid]
+        else:
+            psets = ifcopenshell.util.element.get_psets(product)
+            material_names = None
+            materials = ifcopenshell.util.element.get_materials(product)
+            if materials:
+                material_names = [mat.Name for mat in materials if hasattr(mat, 'Name')]
+            floor, zone = self._find_floor_and_zone(product, is_spatial)
+
+        # Basic element info
+        row = {
+            'GUID': product.GlobalId,
+            'BIM_ID': self.get_bim_id(product, psets),
+            'Entity': entity,
+            'Name': product.Name if hasattr(product, 'Name') else None,
+            'Type': product.ObjectType if hasattr(product, 'ObjectType') else None,
+            'Material': ' | '.join(material_names) if material_names else None,
+            'Floor': floor,
+            'Zone': zone,
+        }
 
-    def create_analysis_ifc(self, ifc_path: Path, excel_data: pd.DataFrame = None, progress_callback=None, custom_filename: str = None) -> Path:
+        return row, psets
+
+    def _find_floor_and_zone(self, product: ifcopenshell.entity_instance, is_spatial: bool) -> tuple:
+        """Resolve Floor/Zone by walking inverse relationships of a single element"""
+        # Extract Floor/Storey information (skip for spatial container elements)
+        floor = None
+        if not is_spatial:
+            if hasattr(product, 'ContainedInStructure'):
+                for rel in product.ContainedInStructure:
+                    if rel.is_a('IfcRelContainedInSpatialStructure'):
+                        relating_structure = rel.RelatingStructure
+                        if relating_structure.is_a('IfcBuildingStorey'):
+                            floor = relating_structure.Name if hasattr(relating_structure, 'Name') else relating_structure.LongName
+                            break
+
+        # Extract Zone/Space information
+        zone = None
+        if hasattr(product, 'HasAssignments'):
+            for rel in product.HasAssignments:
+                if rel.is_a('IfcRelAssignsToGroup'):
+                    relating_group = rel.RelatingGroup
+                    if relating_group.is_a('IfcZone'):
+                        zone = relating_group.Name if hasattr(relating_group, 'Name') else None
+                        break
+
+        # Also check if element is in a space (skip for spatial container elements)
+        if not zone and not is_spatial:
+            if hasattr(product, 'ContainedInStructure'):
+                for rel in product.ContainedInStructure:
+                    if rel.is_a('IfcRelContainedInSpatialStructure'):
+                        relating_structure = rel.RelatingStructure
+                        if relating_structure.is_a('IfcSpace'):
+                            zone = relating_structure.Name if hasattr(relating_structure, 'Name') else relating_structure.LongName
+                            break
+
+        return floor, zone
+
+    def analysis_ifc_path(self, ifc_path: Path, custom_filename: str = None, compressed: bool = False) -> Path:
+        """Where create_analysis_ifc writes the analysis copy of ifc_path"""
+        if custom_filename:
+            analysis_name = custom_filename
+        else:
+            analysis_name = ifc_path.stem + "_analyse" + (".ifczip" if compressed else ifc_path.suffix)
+        return ifc_path.parent / "Skiplum demo" / analysis_name
+
+    def resolve_analysis_ifc(self, name: str) -> Optional[Path]:
+        """
+        Existing analysis IFC called name in the "Skiplum demo" folder, or None
+
+        For names from untrusted input (e.g. a loaded session file): only the
+        file name is used, it must be an .ifc/.ifczip, and the resolved path
+        must stay inside the folder.
+        """
+        if not name:
+            return None
+        folder = (self.input_folder / "Skiplum demo").resolve()
+        candidate = (folder / Path(str(name)).name).resolve()
+        if candidate.parent != folder or candidate.suffix.lower() not in ('.ifc', '.ifczip'):
+            logger.warning(f"Rejected analysis IFC outside {folder}: {name}")
+            return None
+        return candidate if candidate.is_file() else None
+
+    def create_analysis_ifc(self, ifc_path: Path, excel_data: pd.DataFrame = None, progress_callback=None, custom_filename: str = None,
+                            ifc: ifcopenshell.file = None, include_types: tuple = LCA_ENTITY_TYPES,
+                            exclude_types: tuple = None, compressed: bool = False,
+                            index: IFCRelationshipIndex = None) -> Path:
         """
         Create analysis copy in "Skiplum demo" folder within original IFC directory
 
@@ -197,29 +2054,36 @@ class SimpleIFCSync:
 
         Args:
             ifc_path: Path to IFC file
-            excel_data: Optional DataFrame with extracted data
+            excel_data: Optional DataFrame with extracted data. Its
+                G55_LCA.Gjenbruksstatus values (e.g. decisions carried over by
+                extract_incremental) are used for new G55_LCA psets instead of NY
             progress_callback: Optional callback function(current, total, message)
-            custom_filename: Optional custom filename for analysis IFC
+            custom_filename: Optional custom filename for analysis IFC (a .ifczip
+                name writes a compressed ifcZIP, see write_ifc_atomic)
+            ifc: Already opened model for ifc_path, skips parsing the file again.
+                The model is modified in place (psets are added to it)
+            include_types: Entity types that get G55 psets, subtypes included
+                (None = every IfcProduct); see select_products
+            exclude_types: Entity types to skip
+            compressed: Default to "<stem>_analyse.ifczip" instead of ".ifc"
+                (smaller upload/download, slower write)
+            index: IFCRelationshipIndex already built for ifc (e.g. by extraction),
+                used to look up existing psets; pass ifc with it
         """
         # Create "Skiplum demo" folder in the same directory as the original IFC
-        skiplum_folder = ifc_path.parent / "Skiplum demo"
-        skiplum_folder.mkdir(exist_ok=True, parents=True)
-
-        if custom_filename:
-            analysis_name = custom_filename
-        else:
-            analysis_name = ifc_path.stem + "_analyse" + ifc_path.suffix
-
-        analysis_path = skiplum_folder / analysis_name
+        analysis_path = self.analysis_ifc_path(ifc_path, custom_filename, compressed)
+        analysis_path.parent.mkdir(exist_ok=True, parents=True)
+        analysis_name = analysis_path.name
 
         logger.info(f"🏗️  Creating analysis IFC: {analysis_name}")
 
-        if progress_callback:
-            progress_callback(0, 100, "Åpner IFC for analyse...")
+        # Open original IFC unless the caller shares an opened model
+        if ifc is None:
+            if progress_callback:
+                progress_callback(0, 100, "Åpner IFC for analyse...")
+            ifc = ifcopenshell.open(str(ifc_path))
 
-        # Open original IFC
-        ifc = ifcopenshell.open(str(ifc_path))
-        products = ifc.by_type("IfcProduct")
+        products = select_products(ifc, include_types, exclude_types)
         total_products = len(products)
 
         # File metadata
@@ -229,24 +2093,55 @@ class SimpleIFCSync:
         if progress_callback:
             progress_callback(5, 100, f"Legger til egenskaper til {total_products} elementer...")
 
+        statuses = None
+        status_col = 'G55_LCA.Gjenbruksstatus'
+        if excel_data is not None and status_col in excel_data.columns:
+            known = excel_data[excel_data[status_col].notna()]
+            statuses = dict(zip(known['GUID'].astype(str), known[status_col].astype(str)))
+
+        self._add_g55_psets_bulk(ifc, products, basert_pa_ifc, progress_callback, statuses, index)
+
+        if progress_callback:
+            progress_callback(90, 100, "Lagrer analyse-IFC...")
+
+        # Save analysis IFC
+        write_ifc_atomic(ifc, analysis_path)
+        logger.info(f"✅ Saved: {analysis_path}")
+
+        if progress_callback:
+            progress_callback(100, 100, "Analyse-IFC opprettet!")
+
+        return analysis_path
+
+    def _add_g55_psets_bulk(self, ifc: ifcopenshell.file, products: list, basert_pa_ifc: str, progress_callback=None,
+                            statuses: dict = None, index: IFCRelationshipIndex = None):
+        """
+        Add G55_Prosjektinfo and G55_LCA to products by creating entities directly
+
+        Bypasses ifcopenshell.api.run (two calls per product). G55_Prosjektinfo
+        holds project-level values, so one property set is shared by all
+        products through a single IfcRelDefinesByProperties (per-element edits
+        copy it, see PropertyEntityIndex). G55_LCA is per element since
+        External_ID/Original_MMI/Gjenbruksstatus differ.
+        Products that already have a pset keep it. Gjenbruksstatus is taken
+        from statuses (GUID → value) where given, otherwise NY. index is built
+        here unless the caller has one for ifc from before the psets are added.
+        """
+        statuses = statuses or {}
+        if index is None:
+            index = IFCRelationshipIndex(ifc)
+        owner_history = next(iter(ifc.by_type("IfcOwnerHistory")), None)
+        reporter = ProgressReporter(progress_callback, len(products), "Legger til egenskaper", end=90)
+
+        prosjektinfo_targets = []
         for idx, product in enumerate(products):
             try:
-                psets = ifcopenshell.util.element.get_psets(product)
+                psets = index.get_psets(product)
 
-                # Add G55_Prosjektinfo if missing
                 if "G55_Prosjektinfo" not in psets:
-                    pset = ifcopenshell.api.run("pset.add_pset", ifc, product=product, name="G55_Prosjektinfo")
-                    props = {
-                        "Prosjekt": "Grønland 55",
-                        "Opprettet": datetime.now().isoformat(),
-                        "Status": "Analyse"
-                    }
-                    ifcopenshell.api.run("pset.edit_pset", ifc, pset=pset, properties=props)
+                    prosjektinfo_targets.append(product)
 
-                # Add G55_LCA if missing
                 if "G55_LCA" not in psets:
-                    pset = ifcopenshell.api.run("pset.add_pset", ifc, product=product, name="G55_LCA")
-
                     # Get original MMI value if it exists
                     original_mmi = ""
                     for pset_name, pset_props in psets.items():
@@ -261,41 +2156,102 @@ class SimpleIFCSync:
                         "External_ID": product.GlobalId,
                         "Basert_på_IFC": basert_pa_ifc,
                         "Original_MMI": original_mmi,  # Store original MMI value
-                        "Gjenbruksstatus": "NY",  # Default to new - editable in demo
+                        "Gjenbruksstatus": statuses.get(product.GlobalId, "NY"),  # Default to new - editable in demo
                         "LCA_Status": "Pending",
                         "CO2_kg": "",
                         "LCA_Method": "",
                         "Notes": ""
                     }
-                    ifcopenshell.api.run("pset.edit_pset", ifc, pset=pset, properties=props)
+                    pset = self._create_label_pset(ifc, "G55_LCA", props, owner_history)
+                    ifc.create_entity("IfcRelDefinesByProperties", GlobalId=ifcopenshell.guid.new(),
+                                      OwnerHistory=owner_history, RelatedObjects=[product],
+                                      RelatingPropertyDefinition=pset)
 
-                # Report progress
-                if progress_callback and (idx % max(1, total_products // 10) == 0 or idx % 100 == 0):
-                    progress = int(5 + (idx / total_products * 85))
-                    progress_callback(progress, 100, f"Behandler element {idx}/{total_products}...")
+                reporter.update(idx + 1)
 
             except Exception as e:
                 logger.warning(f"Error adding psets to {product.GlobalId}: {e}")
                 continue
 
-        if progress_callback:
-            progress_callback(90, 100, "Lagrer analyse-IFC...")
-
-        # Save analysis IFC
-        ifc.write(str(analysis_path))
-        logger.info(f"✅ Saved: {analysis_path}")
+        # One shared project pset for every product that lacks it
+        if prosjektinfo_targets:
+            props = {
+                "Prosjekt": "Grønland 55",
+                "Opprettet": datetime.now().isoformat(),
+                "Status": "Analyse"
+            }
+            pset = self._create_label_pset(ifc, "G55_Prosjektinfo", props, owner_history)
+            ifc.create_entity("IfcRelDefinesByProperties", GlobalId=ifcopenshell.guid.new(),
+                              OwnerHistory=owner_history, RelatedObjects=prosjektinfo_targets,
+                              RelatingPropertyDefinition=pset)
+
+    def _create_label_pset(self, ifc: ifcopenshell.file, name: str, properties: dict,
+                           owner_history: ifcopenshell.entity_instance = None) -> ifcopenshell.entity_instance:
+        """Create an IfcPropertySet of IfcLabel single values (not yet related to any object)"""
+        has_properties = [
+            ifc.create_entity("IfcPropertySingleValue", Name=prop_name,
+                              NominalValue=ifc.create_entity("IfcLabel", str(value)))
+            for prop_name, value in properties.items()
+        ]
+        return ifc.create_entity("IfcPropertySet", GlobalId=ifcopenshell.guid.new(), OwnerHistory=owner_history,
+                                 Name=name, HasProperties=has_properties)
+
+    def open_analysis_model(self, analysis_ifc_path: Path) -> ifcopenshell.file:
+        """
+        Resident analysis model for analysis_ifc_path
 
-        if progress_callback:
-            progress_callback(100, 100, "Analyse-IFC opprettet!")
+        Reuses the model kept in memory since the last edit (or since
+        run_workflow created it). It is re-read from disk if another file is
+        requested or the file was changed outside this session.
+        """
+        session = self.analysis_session
+        if session is not None and session.is_open and session.path.resolve() == Path(analysis_ifc_path).resolve():
+            if not session.is_stale():
+                return session.ifc
+            logger.info(f"♻️ Analysis IFC changed on disk, reloading: {session.path.name}")
+
+        self.close_analysis_model()
+        self.analysis_session = IFCModelSession(analysis_ifc_path)
+        return self.analysis_session.open()
+
+    def save_analysis_model(self):
+        """Save the resident analysis model, in the background if write-behind is enabled"""
+        if self.writer is not None:
+            self.writer.schedule(self.analysis_session)
+        else:
+            self.analysis_session.write()
 
-        return analysis_path
+    def flush_writes(self, timeout: float = None) -> bool:
+        """Wait until queued analysis IFC saves are on disk. Returns False on timeout"""
+        if self.writer is None:
+            return True
+        return self.writer.flush(timeout)
+
+    def close_analysis_model(self):
+        """Release the resident analysis model and the state derived from it"""
+        self.flush_writes()
+        if self.analysis_session is not None:
+            self.analysis_session.close()
+            self.analysis_session = None
+        self._property_index = None
+        self._persisted_status = None
+
+    def analysis_property_index(self) -> PropertyEntityIndex:
+        """Pset entity index for the resident analysis model (built once per load)"""
+        if self._property_index is None or self._property_index.ifc is not self.analysis_session.ifc:
+            self._property_index = PropertyEntityIndex(self.analysis_session.ifc)
+        return self._property_index
 
     def update_ifc_from_dataframe(self, df: pd.DataFrame, analysis_ifc_path: Path) -> bool:
         """
         Update analysis IFC directly from DataFrame (fast, no Excel intermediary)
 
         This is optimized for demo scenarios where we want instant Solibri updates.
-        Updates G55_LCA.Gjenbruksstatus and other editable properties.
+        Updates G55_LCA.Gjenbruksstatus for elements whose value differs from the
+        last persisted state (vectorised diff), so a scenario click costs
+        O(changed elements) rather than O(model). Nothing is written if no
+        value changed. The number of touched elements is kept in
+        self.last_updated_count.
 
         Args:
             df: DataFrame with updated values
@@ -305,58 +2261,69 @@ class SimpleIFCSync:
             True if successful, False otherwise
         """
         logger.info(f"🔄 Updating IFC directly from DataFrame")
+        self.last_updated_count = 0
+        status_col = 'G55_LCA.Gjenbruksstatus'
 
         try:
-            # Open analysis IFC
-            ifc = ifcopenshell.open(str(analysis_ifc_path))
+            # Resident analysis model (parsed only if not already in memory)
+            self.open_analysis_model(analysis_ifc_path)
 
-            updated_count = 0
+            if status_col not in df.columns:
+                logger.info("No Gjenbruksstatus column - nothing to update")
+                return True
 
-            # Process each row in DataFrame
-            for idx, row in df.iterrows():
-                try:
-                    guid = row['GUID']
-                    element = ifc.by_guid(guid)
+            index = self.analysis_property_index()
+            if self._persisted_status is None:
+                status = index.values('G55_LCA', 'Gjenbruksstatus')
+                self._persisted_status = pd.Series(
+                    {guid: None if value is None else str(value) for guid, value in status.items()}, dtype=object)
 
-                    # Update G55_LCA properties
-                    psets = ifcopenshell.util.element.get_psets(element)
+            # Vectorised diff against what the analysis IFC currently holds
+            new_status = df[['GUID', status_col]].dropna().drop_duplicates('GUID', keep='last')
+            new_status = new_status.set_index('GUID')[status_col].astype(str)
+            old_status = self._persisted_status.reindex(new_status.index)
+            changed = new_status[new_status != old_status]
 
-                    if 'G55_LCA' in psets:
-                        # Get existing pset
-                        pset_rels = [p for p in element.IsDefinedBy
-                                   if p.is_a("IfcRelDefinesByProperties")
-                                   and p.RelatingPropertyDefinition.Name == "G55_LCA"]
+            if changed.empty:
+                logger.info("✅ No Gjenbruksstatus changes - IFC not rewritten")
+                return True
 
-                        if pset_rels:
-                            pset = pset_rels[0].RelatingPropertyDefinition
+            updated_count = 0
 
-                            # Update Gjenbruksstatus if changed
-                            if 'G55_LCA.Gjenbruksstatus' in row.index and pd.notna(row['G55_LCA.Gjenbruksstatus']):
-                                props = {'Gjenbruksstatus': str(row['G55_LCA.Gjenbruksstatus'])}
-                                ifcopenshell.api.run("pset.edit_pset", ifc, pset=pset, properties=props)
-                                updated_count += 1
+            # Apply only changed elements (locked against a background write)
+            with self.analysis_session.lock:
+                for guid, status in changed.items():
+                    try:
+                        if index.set_value(guid, 'G55_LCA', 'Gjenbruksstatus', status):
+                            self._persisted_status[guid] = status
+                            updated_count += 1
 
-                except Exception as e:
-                    logger.warning(f"Error updating element {guid}: {e}")
-                    continue
+                    except Exception as e:
+                        logger.warning(f"Error updating element {guid}: {e}")
+                        continue
 
-            # Save updated IFC
-            ifc.write(str(analysis_ifc_path))
+            if updated_count:
+                # Save updated IFC
+                self.save_analysis_model()
 
-            logger.info(f"✅ Updated {updated_count} elements in IFC")
+            self.last_updated_count = updated_count
+            logger.info(f"✅ Updated {updated_count} of {len(new_status)} elements in IFC")
             return True
 
         except Exception as e:
             logger.error(f"❌ IFC update failed: {e}")
+            self.close_analysis_model()
             return False
 
-    def save_dataframe_to_excel(self, df: pd.DataFrame, excel_path: Path) -> bool:
+    def save_dataframe_to_excel(self, df: pd.DataFrame, excel_path: Path, streaming: bool = True) -> bool:
         """
         Save DataFrame to Excel file (on-demand)
 
         Args:
             df: DataFrame with element data
             excel_path: Path where Excel should be saved
+            streaming: Write with constant memory (see write_excel_streaming).
+                False builds the whole workbook in memory with pd.ExcelWriter
 
         Returns:
             True if successful, False otherwise
@@ -368,11 +2335,14 @@ class SimpleIFCSync:
             excel_path.parent.mkdir(exist_ok=True, parents=True)
 
             # Save with formatted columns
-            with pd.ExcelWriter(excel_path, engine='openpyxl') as writer:
-                df.to_excel(writer, sheet_name='Elements', index=False)
-                worksheet = writer.sheets['Elements']
-                for col in worksheet.columns:
-                    worksheet.column_dimensions[col[0].column_letter].width = 25
+            if streaming:
+                write_excel_streaming(with_metadata_columns(df), excel_path)
+            else:
+                with pd.ExcelWriter(excel_path, engine='openpyxl') as writer:
+                    with_metadata_columns(df).to_excel(writer, sheet_name='Elements', index=False)
+                    worksheet = writer.sheets['Elements']
+                    for col in worksheet.columns:
+                        worksheet.column_dimensions[col[0].column_letter].width = 25
 
             logger.info(f"✅ Saved Excel: {excel_path}")
             return True
@@ -381,74 +2351,159 @@ class SimpleIFCSync:
             logger.error(f"❌ Excel save failed: {e}")
             return False
 
+    def save_dataframe(self, df: pd.DataFrame, path: Path, format: str = 'parquet', metadata: dict = None) -> Path:
+        """
+        Save DataFrame as Parquet or Feather (Arrow IPC) for fast reloading
+
+        Unlike Excel, dtypes (categoricals, float quantities) are kept and
+        the file reads back in milliseconds. df.attrs, plus metadata (e.g. the
+        analysis IFC path), are stored in the Arrow schema metadata and
+        restored by load_dataframe. Mixed-type columns are stored as strings
+        (see make_parquet_safe).
+
+        Args:
+            df: DataFrame with element data
+            path: Output file path
+            format: 'parquet' or 'feather'
+            metadata: Extra JSON-serialisable values stored with df.attrs
+
+        Returns:
+            The written path
+        """
+        if format not in SESSION_FORMATS:
+            raise ValueError(f"Unsupported format {format!r}, expected one of {SESSION_FORMATS}")
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(make_parquet_safe(df), preserve_index=False)
+        attrs = json.dumps({**df.attrs, **(metadata or {})}, default=str).encode('utf-8')
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), FRAME_ATTRS_KEY: attrs})
+
+        path.parent.mkdir(exist_ok=True, parents=True)
+        if format == 'parquet':
+            import pyarrow.parquet as pq
+            pq.write_table(table, path)
+        else:
+            import pyarrow.feather as feather
+            feather.write_feather(table, path)
+
+        logger.info(f"💾 Saved {len(df)} rows to {path.name} ({format})")
+        return path
+
+    def load_dataframe(self, source, format: str = None) -> pd.DataFrame:
+        """
+        Load a DataFrame written by save_dataframe, with df.attrs restored
+
+        Args:
+            source: File path or binary file object (e.g. a Streamlit upload)
+            format: 'parquet' or 'feather' (default: from the file name suffix)
+        """
+        if format is None:
+            format = Path(getattr(source, 'name', str(source))).suffix.lstrip('.').lower()
+        if format == 'parquet':
+            import pyarrow.parquet as pq
+            table = pq.read_table(source)
+        elif format == 'feather':
+            import pyarrow.feather as feather
+            table = feather.read_table(source)
+        else:
+            raise ValueError(f"Unsupported format {format!r}, expected one of {SESSION_FORMATS}")
+
+        df = table.to_pandas()
+        attrs = (table.schema.metadata or {}).get(FRAME_ATTRS_KEY)
+        if attrs:
+            df.attrs.update(json.loads(attrs))
+        logger.info(f"📖 Loaded {len(df)} rows ({format})")
+        return df
+
     def sync_excel_to_ifc(self, excel_path: Path, analysis_ifc_path: Path) -> bool:
         """
         Sync Excel edits back to analysis IFC
 
         Updates property sets in analysis IFC based on Excel columns
         Columns with "." are treated as "PropertySet.PropertyName"
+
+        Current IFC values are loaded into a DataFrame and diffed against the
+        sheet column-wise; only changed cells are written, and each missing
+        property set is created once per element. Empty cells, psets inherited from the element type
+        and "<pset>.id" columns (entity ids from extraction) are not written, nor
+        are quantity sets and enumerated/list/bounded properties.
         """
         logger.info(f"🔄 Syncing Excel → IFC")
         logger.info(f"  Excel: {excel_path.name}")
         logger.info(f"  IFC: {analysis_ifc_path.name}")
 
         try:
-            # Read Excel
-            df = pd.read_excel(excel_path)
-
-            # Open analysis IFC
-            ifc = ifcopenshell.open(str(analysis_ifc_path))
-
-            updated_count = 0
-
-            # Process each row
-            for idx, row in df.iterrows():
-                try:
-                    guid = row['GUID']
-                    element = ifc.by_guid(guid)
-
-                    # Update properties
-                    for col in row.index:
-                        if '.' in col and pd.notna(row[col]) and not col.startswith('_'):
-                            # Parse property set and property name
-                            pset_name, prop_name = col.rsplit('.', 1)
-
-                            # Get existing psets
-                            psets = ifcopenshell.util.element.get_psets(element)
-
-                            if pset_name in psets:
-                                # Update existing pset
-                                pset_rels = [p for p in element.IsDefinedBy
-                                           if p.is_a("IfcRelDefinesByProperties")
-                                           and p.RelatingPropertyDefinition.Name == pset_name]
-
-                                if pset_rels:
-                                    pset = pset_rels[0].RelatingPropertyDefinition
-                                    props = {prop_name: str(row[col])}
-                                    ifcopenshell.api.run("pset.edit_pset", ifc, pset=pset, properties=props)
-                            else:
-                                # Create new pset
-                                pset = ifcopenshell.api.run("pset.add_pset", ifc, product=element, name=pset_name)
-                                props = {prop_name: str(row[col])}
-                                ifcopenshell.api.run("pset.edit_pset", ifc, pset=pset, properties=props)
-
-                    updated_count += 1
-
-                except Exception as e:
-                    logger.warning(f"Error updating element {guid}: {e}")
-                    continue
+            # Read GUID and property columns only (fast engine when installed)
+            df = read_property_sheet(excel_path)
+
+            # Resident analysis model (parsed only if not already in memory)
+            ifc = self.open_analysis_model(analysis_ifc_path)
+            index = self.analysis_property_index()
+
+            prop_cols = [col for col in df.columns if is_property_column(col)]
+            sheet = df.dropna(subset=['GUID']).drop_duplicates('GUID', keep='last').set_index('GUID')[prop_cols]
+
+            # Column-wise diff of normalised values; empty Excel cells are never written
+            current, read_only = index.current_values(prop_cols)
+            current = current.reindex(sheet.index)
+            sheet_norm = sheet.apply(lambda col: col.map(normalise_cell))
+            current_norm = current.apply(lambda col: col.map(normalise_cell))
+            changed = sheet.notna() & sheet_norm.ne(current_norm)
+
+            # Type psets, quantity sets and non-single-value properties are not edited per element
+            for col, guids in read_only.items():
+                rows = changed.index.intersection(guids)
+                if len(rows):
+                    changed.loc[rows, col] = False
+
+            row_pos, col_pos = changed.to_numpy().nonzero()
+            if len(row_pos) == 0:
+                logger.info("✅ No changes in Excel - IFC not rewritten")
+                return True
+
+            values = sheet.to_numpy()[row_pos, col_pos]
+            changes = zip(sheet.index[row_pos], sheet.columns[col_pos], values)
+            updated_guids = set()
+            applied = 0
+
+            # Apply changed cells, element by element (locked against a background write)
+            with self.analysis_session.lock:
+                for guid, col, value in changes:
+                    pset_name, prop_name = col.rsplit('.', 1)
+                    try:
+                        if index.get_pset(guid, pset_name) is None:
+                            # Create new pset
+                            index.add_pset(ifc.by_guid(guid), pset_name)
+                        if index.set_value(guid, pset_name, prop_name, str(value)):
+                            applied += 1
+                            updated_guids.add(guid)
+
+                    except Exception as e:
+                        logger.warning(f"Error updating {col} on element {guid}: {e}")
+                        continue
+
+            if not applied:
+                logger.info("✅ No editable changes in Excel - IFC not rewritten")
+                return True
 
             # Save updated IFC
-            ifc.write(str(analysis_ifc_path))
+            self.save_analysis_model()
+            # Excel may have changed Gjenbruksstatus too; re-read on next delta update
+            self._persisted_status = None
 
-            logger.info(f"✅ Updated {updated_count} elements in IFC")
+            logger.info(f"✅ Updated {applied} values on {len(updated_guids)} elements in IFC")
             return True
 
         except Exception as e:
             logger.error(f"❌ Sync failed: {e}")
+            self.close_analysis_model()
             return False
 
-    def run_workflow(self, ifc_filename: str, progress_callback=None, excel_filename: str = None, analysis_ifc_filename: str = None) -> dict:
+    def run_workflow(self, ifc_filename: str, progress_callback=None, excel_filename: str = None, analysis_ifc_filename: str = None,
+                     workers: int = 1, use_cache: bool = True, compute_volumes: bool = False,
+                     previous_ifc_filename: str = None, previous_df: pd.DataFrame = None,
+                     include_types: tuple = LCA_ENTITY_TYPES, exclude_types: tuple = None,
+                     store_hashes: bool = True) -> dict:
         """
         Run complete workflow for a single IFC file
 
@@ -457,8 +2512,28 @@ class SimpleIFCSync:
             progress_callback: Optional callback function(step, total_steps, message)
             excel_filename: Optional custom Excel output filename
             analysis_ifc_filename: Optional custom analysis IFC output filename
-
-        Returns dict with paths to created files
+                (".ifczip" writes a compressed ifcZIP)
+            workers: Number of worker processes for extraction (1 = serial)
+            use_cache: Reuse a cached extraction of the same IFC content if available.
+                The analysis IFC is reused too if it was created from the same
+                content and has not been written since; it is then parsed only
+                on the first edit
+            compute_volumes: Fill Volume_m3 from element geometry where the model
+                has no volume quantity (slower; see compute_geometry_volumes)
+            previous_ifc_filename: Previous revision of the same model in the input
+                folder. Unchanged elements are reused and Gjenbruksstatus decisions
+                carry over into the new analysis IFC (see extract_incremental)
+            previous_df: DataFrame with the previous revision's decisions
+            include_types: Entity types to extract and give G55 psets, subtypes
+                included (default: building elements; None = every IfcProduct)
+            exclude_types: Entity types to skip
+            store_hashes: Also cache element content hashes (serial extraction
+                only; cheap with the extraction's index), so a later incremental
+                run against this file does not parse it again
+
+        Returns dict with the analysis IFC path, the extracted DataFrame, the
+        material layer table (see extract_material_layers) and, for incremental
+        runs, the change summary ('changes', otherwise None)
         """
         logger.info("="*60)
         logger.info("🚀 Starting Simple IFC-Excel Sync Workflow")
@@ -475,17 +2550,94 @@ class SimpleIFCSync:
         if progress_callback:
             progress_callback(1, 3, "Ekstraherer IFC-data...")
 
-        df = self.extract_ifc_to_excel(ifc_path, progress_callback)
-
-        # Note: Excel is NOT saved automatically - only on explicit user request
-        logger.info(f"✅ Extracted {len(df)} elements to DataFrame (Excel NOT saved)")
-
-        # Step 2: Create analysis IFC
-        logger.info("\n🏗️  Step 2: Creating analysis IFC")
-        if progress_callback:
-            progress_callback(2, 3, "Oppretter analyse-IFC...")
-
-        analysis_path = self.create_analysis_ifc(ifc_path, df, progress_callback, custom_filename=analysis_ifc_filename)
+        # One parsed model shared by both stages (opened on first use)
+        session = IFCModelSession(ifc_path)
+        try:
+            df = None
+            changes = None
+            index = None
+            filters = {
+                'include_types': tuple(include_types) if include_types is not None else None,
+                'exclude_types': tuple(exclude_types) if exclude_types else None,
+            }
+            cache_key = self.extract_cache.key_for(ifc_path, **filters) if use_cache else None
+            if previous_ifc_filename and previous_ifc_filename != ifc_filename:
+                # Not cached: the frame carries the previous revision's decisions,
+                # and the cache must only hold what the file itself contains
+                df, changes = self.extract_incremental(ifc_path, self.input_folder / previous_ifc_filename,
+                                                       previous_df, progress_callback, ifc=session.open(), **filters)
+            elif use_cache:
+                df = self.extract_cache.get(cache_key)
+                if df is not None:
+                    # Same content may have been uploaded under another name
+                    df.attrs['source_file'] = ifc_path.name
+                    logger.info("⚡ Loaded extraction from cache")
+
+            if df is None:
+                if workers <= 1:
+                    shared_ifc = session.open()
+                    index = IFCRelationshipIndex(shared_ifc)
+                    df = self.extract_ifc_to_excel(ifc_path, progress_callback, ifc=shared_ifc, index=index, **filters)
+                    if store_hashes and use_cache:
+                        # Same index, so the next revision's comparison skips parsing this file
+                        self.content_hashes(ifc_path, ifc=shared_ifc, index=index, **filters)
+                else:
+                    # Parallel workers parse the file themselves
+                    df = self.extract_ifc_to_excel(ifc_path, progress_callback, workers=workers, **filters)
+                if use_cache:
+                    self.extract_cache.put(cache_key, df)
+
+            # Pending saves of the previous analysis model land before its file is checked
+            self.close_analysis_model()
+
+            # Unedited analysis IFC of the same content and options: no parse, no rewrite.
+            # Incremental runs carry decisions over, so their output is never reused
+            analysis_path = self.analysis_ifc_path(ifc_path, analysis_ifc_filename)
+            analysis_key = None
+            if use_cache and changes is None:
+                analysis_key = self.extract_cache.key_for(ifc_path, stage='analysis_ifc', **filters)
+            reuse_analysis = analysis_key is not None and self.extract_cache.output_matches(analysis_key, analysis_path)
+            if not reuse_analysis:
+                session.open()
+
+            # Stages below are cached too; only parse for them if the model is open anyway
+            if compute_volumes:
+                volumes = self.compute_geometry_volumes(ifc_path, ifc=session.ifc, progress_callback=progress_callback,
+                                                        use_cache=use_cache, **filters)
+                # Quantities exported by the authoring tool win over tessellated volumes
+                df['Volume_m3'] = df['Volume_m3'].fillna(df['GUID'].map(volumes))
+
+            layers = self.extract_material_layers(ifc_path, ifc=session.ifc, use_cache=use_cache)
+
+            # Note: Excel is NOT saved automatically - only on explicit user request
+            logger.info(f"✅ Extracted {len(df)} elements to DataFrame (Excel NOT saved)")
+
+            # Step 2: Create analysis IFC
+            logger.info("\n🏗️  Step 2: Creating analysis IFC")
+            if progress_callback:
+                progress_callback(2, 3, "Oppretter analyse-IFC...")
+
+            if reuse_analysis:
+                logger.info(f"⚡ Reusing analysis IFC: {analysis_path.name}")
+            else:
+                # Index from serial extraction (same model, no G55 psets yet) is reused
+                analysis_path = self.create_analysis_ifc(ifc_path, df, progress_callback,
+                                                         custom_filename=analysis_ifc_filename,
+                                                         ifc=session.open(), index=index, **filters)
+                if analysis_key is not None:
+                    self.extract_cache.record_output(analysis_key, analysis_path)
+        except Exception:
+            session.close()
+            raise
+
+        if reuse_analysis:
+            # Bound but not parsed: open_analysis_model loads it on the first edit
+            session.close()
+            self.analysis_session = IFCModelSession(analysis_path)
+        else:
+            # The model now holds the analysis psets; keep it resident for updates
+            session.rebind(analysis_path)
+            self.analysis_session = session
 
         if progress_callback:
             progress_callback(3, 3, "Fullført!")
@@ -504,7 +2656,9 @@ class SimpleIFCSync:
 
         return {
             'analysis_ifc': analysis_path,
-            'dataframe': df
+            'dataframe': df,
+            'material_layers': layers,
+            'changes': changes
         }
 
 
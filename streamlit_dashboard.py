@@ -14,11 +14,19 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+from io import BytesIO
 from pathlib import Path
+from urllib.parse import quote
+import html
+import json
+import os
+import secrets
+import shutil
 import sys
+import time
 
 # Import the sync module
-from ifc_sync_simple import SimpleIFCSync
+from ifc_sync_simple import SimpleIFCSync, material_volumes, with_metadata_columns, write_excel_streaming
 
 st.set_page_config(
     page_title="BIM LCA-verktøy",
@@ -78,7 +86,9 @@ def is_cloud_deployment():
 if 'sync' not in st.session_state:
     # Auto-detect environment
     use_temp = is_cloud_deployment()
-    st.session_state.sync = SimpleIFCSync(input_folder="input", output_folder="output", use_temp=use_temp)
+    # Analysis IFC saves run in the background, coalesced to at most one per 500 ms
+    st.session_state.sync = SimpleIFCSync(input_folder="input", output_folder="output", use_temp=use_temp,
+                                          write_behind_ms=500)
     st.session_state.is_cloud = use_temp
 
 if 'current_analysis_ifc' not in st.session_state:
@@ -87,6 +97,18 @@ if 'current_analysis_ifc' not in st.session_state:
 if 'df' not in st.session_state:
     st.session_state.df = None
 
+# Bumped on every change of st.session_state.df (see set_session_df); exports
+# are built on request and reused while the version is unchanged
+if 'df_version' not in st.session_state:
+    st.session_state.df_version = 0
+
+if 'excel_export' not in st.session_state:
+    st.session_state.excel_export = None
+
+# Element × material layer table from run_workflow (see material_volumes)
+if 'material_layers' not in st.session_state:
+    st.session_state.material_layers = None
+
 # Processing state management
 if 'is_processing' not in st.session_state:
     st.session_state.is_processing = False
@@ -98,10 +120,114 @@ if 'progress_message' not in st.session_state:
     st.session_state.progress_message = ""
 
 
+# Files linked here are served by Streamlit's static file handler (server.enableStaticServing)
+STATIC_DOWNLOADS = Path(__file__).parent / "static" / "downloads"
+# Session folders not used for this long are removed when a new session starts
+STATIC_DOWNLOAD_MAX_AGE_HOURS = 12
+
+
+def prune_static_downloads(max_age_hours: float = STATIC_DOWNLOAD_MAX_AGE_HOURS):
+    """Remove per-session download folders that have not been used for max_age_hours"""
+    if not STATIC_DOWNLOADS.exists():
+        return
+    cutoff = time.time() - max_age_hours * 3600
+    for folder in STATIC_DOWNLOADS.iterdir():
+        try:
+            if folder.is_dir() and folder.stat().st_mtime < cutoff:
+                shutil.rmtree(folder, ignore_errors=True)
+        except OSError:
+            continue
+
+
+def static_download_url(path: Path):
+    """
+    Relative URL serving path through Streamlit's static file handler
+
+    The file is hard-linked (copied if linking is not possible) into a
+    per-session folder under static/downloads, so the server streams it from
+    disk and it is never read into the Python process. The folder only holds
+    the latest file and is touched on every call; folders of ended sessions
+    are pruned when a new session starts. Returns None when static serving
+    is disabled or the link cannot be created.
+    """
+    if not st.get_option("server.enableStaticServing"):
+        return None
+    if 'download_token' not in st.session_state:
+        prune_static_downloads()
+        st.session_state.download_token = secrets.token_urlsafe(16)
+
+    folder = STATIC_DOWNLOADS / st.session_state.download_token
+    target = folder / path.name
+    try:
+        folder.mkdir(parents=True, exist_ok=True)
+        os.utime(folder)
+        # Earlier analysis files of this session (other names) are no longer offered
+        for stale in folder.iterdir():
+            if stale.name != path.name:
+                stale.unlink(missing_ok=True)
+        source = path.stat()
+        # Saves replace the file (new inode), so relink when it changed
+        if not (target.exists() and (os.path.samefile(path, target) or
+                                     (target.stat().st_size, target.stat().st_mtime_ns) ==
+                                     (source.st_size, source.st_mtime_ns))):
+            tmp = folder / f".{path.name}.tmp"
+            tmp.unlink(missing_ok=True)
+            try:
+                os.link(path, tmp)
+            except OSError:
+                shutil.copy2(path, tmp)
+            os.replace(tmp, target)
+    except OSError:
+        return None
+    return f"app/static/downloads/{st.session_state.download_token}/{quote(path.name)}"
+
+
+def set_session_df(df: pd.DataFrame):
+    """Replace the session DataFrame and invalidate exports built from the previous version"""
+    st.session_state.df = df
+    st.session_state.df_version += 1
+
+
+def excel_bytes(df: pd.DataFrame) -> bytes:
+    """Serialise df (with metadata columns) to an .xlsx workbook in memory"""
+    buffer = BytesIO()
+    write_excel_streaming(with_metadata_columns(df), buffer)
+    return buffer.getvalue()
+
+
+def cached_excel(slot: str, key, df: pd.DataFrame, label: str, prepare_label: str, **download_kwargs):
+    """
+    Excel download built only on request and memoised on key
+
+    While st.session_state[slot] holds a workbook for key, a download button
+    is shown; otherwise a button that builds it. Reruns therefore cost no
+    serialisation until the data changes and the user asks again.
+    """
+    export = st.session_state.get(slot)
+    if export is not None and export['key'] == key:
+        st.download_button(label=label, data=export['data'],
+                           mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                           **download_kwargs)
+    elif st.button(prepare_label, key=f"{slot}_prepare", use_container_width=download_kwargs.get('use_container_width', False),
+                   disabled=download_kwargs.get('disabled', False)):
+        with st.spinner("Genererer Excel..."):
+            try:
+                st.session_state[slot] = {'key': key, 'data': excel_bytes(df)}
+            except Exception as e:
+                st.error(f"❌ Kunne ikke generere Excel: {e}")
+                return
+        st.rerun()
+
+
 def extract_volume_from_properties(df: pd.DataFrame) -> pd.DataFrame:
     """Extract volume data from property columns"""
+    # Quantity/geometry volumes from extraction (Volume_m3) take precedence
+    if 'Volume_m3' in df.columns and df['Volume_m3'].notna().any():
+        return df
+
     # Look for volume-related columns
-    volume_cols = [col for col in df.columns if 'volume' in col.lower() or 'volum' in col.lower()]
+    volume_cols = [col for col in df.columns
+                   if ('volume' in col.lower() or 'volum' in col.lower()) and col != 'Volume_m3']
 
     if volume_cols:
         # Use first volume column found
@@ -195,6 +321,32 @@ with st.sidebar:
         disabled=st.session_state.is_processing
     )
 
+    compute_volumes = st.checkbox(
+        "📐 Beregn volum fra geometri",
+        value=False,
+        help="Beregner volum fra 3D-geometrien for elementer uten volummengder (tregere)",
+        disabled=st.session_state.is_processing
+    )
+
+    compress_ifc = st.checkbox(
+        "🗜️ Komprimert analyse-IFC (.ifczip)",
+        value=st.session_state.is_cloud,
+        help="Mindre fil å laste opp/ned, litt tregere lagring",
+        disabled=st.session_state.is_processing
+    )
+    analysis_suffix = ".ifczip" if compress_ifc else ".ifc"
+
+    # New revision of the loaded model: reuse unchanged elements and keep decisions
+    previous_source = st.session_state.df.attrs.get('source_file') if st.session_state.df is not None else None
+    incremental = previous_source is not None and st.checkbox(
+        f"♻️ Behold gjenbruksstatus fra {previous_source}",
+        value=False,
+        help="Ny revisjon av samme modell: uendrede elementer gjenbrukes og valgt gjenbruksstatus beholdes",
+        disabled=st.session_state.is_processing
+    )
+    previous_kwargs = {'previous_ifc_filename': previous_source,
+                       'previous_df': st.session_state.df} if incremental else {}
+
     if uploaded_file is not None:
         # Save uploaded file to input folder
         script_dir = Path(__file__).parent
@@ -208,7 +360,7 @@ with st.sidebar:
         # Auto-generate filenames based on uploaded file
         default_basename = Path(uploaded_file.name).stem
         excel_filename = f"{default_basename}.xlsx"
-        analysis_ifc_filename = f"{default_basename}_analyse.ifc"
+        analysis_ifc_filename = f"{default_basename}_analyse{analysis_suffix}"
 
         if st.button("🔄 Analyser modell", type="primary", key="extract_uploaded",
                      disabled=st.session_state.is_processing):
@@ -228,13 +380,20 @@ with st.sidebar:
                     uploaded_file.name,
                     progress_callback=update_progress,
                     excel_filename=excel_filename,
-                    analysis_ifc_filename=analysis_ifc_filename
+                    analysis_ifc_filename=analysis_ifc_filename,
+                    compute_volumes=compute_volumes,
+                    **previous_kwargs
                 )
 
                 if result:
                     st.session_state.current_analysis_ifc = result['analysis_ifc']
-                    st.session_state.df = result['dataframe']
+                    set_session_df(result['dataframe'])
+                    st.session_state.material_layers = result['material_layers']
                     st.success(f"✅ Ekstrahert {len(result['dataframe'])} elementer")
+                    if result['changes']:
+                        changes = result['changes']
+                        st.info(f"♻️ {changes['unchanged']} uendret, {changes['changed']} endret, "
+                                f"{changes['added']} nye og {changes['removed']} fjernede elementer")
                     st.info(f"📁 Analyse-IFC lagret i: {result['analysis_ifc']}")
                     st.session_state.is_processing = False
                     st.rerun()
@@ -259,7 +418,7 @@ with st.sidebar:
             # Auto-generate filenames based on selected file
             default_basename = Path(selected_ifc).stem
             excel_filename_selected = f"{default_basename}.xlsx"
-            analysis_ifc_filename_selected = f"{default_basename}_analyse.ifc"
+            analysis_ifc_filename_selected = f"{default_basename}_analyse{analysis_suffix}"
 
             if st.button("🔄 Analyser valgt fil", type="primary", key="extract_selected",
                          disabled=st.session_state.is_processing):
@@ -279,13 +438,20 @@ with st.sidebar:
                         selected_ifc,
                         progress_callback=update_progress,
                         excel_filename=excel_filename_selected,
-                        analysis_ifc_filename=analysis_ifc_filename_selected
+                        analysis_ifc_filename=analysis_ifc_filename_selected,
+                        compute_volumes=compute_volumes,
+                        **previous_kwargs
                     )
 
                     if result:
                         st.session_state.current_analysis_ifc = result['analysis_ifc']
-                        st.session_state.df = result['dataframe']
+                        set_session_df(result['dataframe'])
+                        st.session_state.material_layers = result['material_layers']
                         st.success(f"✅ Ekstrahert {len(result['dataframe'])} elementer")
+                        if result['changes']:
+                            changes = result['changes']
+                            st.info(f"♻️ {changes['unchanged']} uendret, {changes['changed']} endret, "
+                                    f"{changes['added']} nye og {changes['removed']} fjernede elementer")
                         st.info(f"📁 Analyse-IFC lagret i: {result['analysis_ifc']}")
                         st.session_state.is_processing = False
                         st.rerun()
@@ -296,6 +462,28 @@ with st.sidebar:
         else:
             st.info("📂 Ingen IFC-filer funnet i input-mappen")
 
+    # Reload a saved analysis session (Parquet/Feather) without parsing the IFC
+    session_file = st.file_uploader(
+        "📂 Last inn lagret analyseøkt",
+        type=['parquet', 'feather'],
+        help="Økt lagret med «Lagre analyseøkt» - lastes på millisekunder",
+        disabled=st.session_state.is_processing
+    )
+    if session_file is not None and st.button("📂 Åpne analyseøkt", key="load_session",
+                                              disabled=st.session_state.is_processing):
+        try:
+            loaded_df = st.session_state.sync.load_dataframe(session_file)
+        except Exception as e:
+            st.error(f"❌ Kunne ikke laste analyseøkt: {e}")
+        else:
+            st.session_state.sync.close_analysis_model()
+            set_session_df(loaded_df)
+            st.session_state.material_layers = None
+            # Untrusted upload: only a file name inside our own Skiplum demo folder is accepted
+            st.session_state.current_analysis_ifc = st.session_state.sync.resolve_analysis_ifc(
+                loaded_df.attrs.get('analysis_ifc'))
+            st.rerun()
+
     st.markdown("---")
 
     # Optional download section
@@ -329,38 +517,73 @@ with st.sidebar:
                         st.error("❌ Kunne ikke lagre Excel")
 
             with col2:
-                # Download current DataFrame as Excel (in-memory, no save)
-                from io import BytesIO
-                buffer = BytesIO()
-                with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-                    st.session_state.df.to_excel(writer, sheet_name='Elements', index=False)
-                    worksheet = writer.sheets['Elements']
-                    for col in worksheet.columns:
-                        worksheet.column_dimensions[col[0].column_letter].width = 25
-                buffer.seek(0)
-
-                st.download_button(
+                # Download current DataFrame as Excel (in-memory, no save), built on request
+                cached_excel(
+                    'excel_export', st.session_state.df_version, st.session_state.df,
                     label="📥 Last ned Excel",
-                    data=buffer,
+                    prepare_label="📊 Klargjør Excel",
                     file_name=f"{st.session_state.current_analysis_ifc.stem}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
                     help="Last ned Excel-fil direkte (lagres ikke på disk)",
                     disabled=st.session_state.is_processing,
                     use_container_width=True
                 )
 
+            # Parquet keeps dtypes and reloads without parsing the IFC
+            if st.button("💾 Lagre analyseøkt (Parquet)",
+                         use_container_width=True,
+                         disabled=st.session_state.is_processing,
+                         help="Lagrer data og gjenbruksstatus for rask innlasting senere"):
+                session_path = st.session_state.sync.output_folder / f"{st.session_state.current_analysis_ifc.stem}.parquet"
+                st.session_state.sync.save_dataframe(
+                    st.session_state.df, session_path,
+                    metadata={'analysis_ifc': st.session_state.current_analysis_ifc.name})
+                st.success(f"✅ Analyseøkt lagret: {session_path}")
+
+        # Background saves fail after the edit has returned; report them here
+        writer = st.session_state.sync.writer
+        if writer is not None and writer.last_error is not None:
+            st.error(f"❌ Lagring av analyse-IFC feilet: {writer.last_error}")
+            if st.button("💾 Prøv å lagre på nytt", use_container_width=True,
+                         disabled=st.session_state.is_processing or st.session_state.sync.analysis_session is None):
+                st.session_state.sync.save_analysis_model()
+                st.session_state.sync.flush_writes()
+                st.rerun()
+
         # Download Analysis IFC
         if st.session_state.current_analysis_ifc.exists():
-            with open(st.session_state.current_analysis_ifc, "rb") as f:
-                st.download_button(
-                    label="🏗️ Last ned Analyse-IFC",
-                    data=f,
-                    file_name=st.session_state.current_analysis_ifc.name,
-                    mime="application/octet-stream",
-                    help="Last ned oppdatert IFC-fil fra Skiplum demo-mappen",
-                    disabled=st.session_state.is_processing,
-                    use_container_width=True
-                )
+            if writer is not None and writer.has_pending:
+                # Latest edits are still being saved in the background - flush on request
+                # instead of blocking every rerun
+                if st.button("🏗️ Klargjør Analyse-IFC for nedlasting",
+                             use_container_width=True,
+                             disabled=st.session_state.is_processing,
+                             help="Lagrer siste endringer til IFC-filen"):
+                    st.session_state.sync.flush_writes()
+                    st.rerun()
+            else:
+                analysis_ifc = st.session_state.current_analysis_ifc
+                url = static_download_url(analysis_ifc)
+                if url is not None and st.session_state.is_processing:
+                    st.button("🏗️ Last ned Analyse-IFC", disabled=True, use_container_width=True)
+                elif url is not None:
+                    # Streamed from disk by the server; the download attribute saves instead of displaying
+                    size_mb = analysis_ifc.stat().st_size / 1024 / 1024
+                    st.markdown(
+                        f'<a href="{url}" download="{html.escape(analysis_ifc.name)}">'
+                        f'🏗️ Last ned Analyse-IFC ({size_mb:.1f} MB)</a>',
+                        unsafe_allow_html=True
+                    )
+                else:
+                    with open(analysis_ifc, "rb") as f:
+                        st.download_button(
+                            label="🏗️ Last ned Analyse-IFC",
+                            data=f,
+                            file_name=analysis_ifc.name,
+                            mime="application/octet-stream",
+                            help="Last ned oppdatert IFC-fil fra Skiplum demo-mappen",
+                            disabled=st.session_state.is_processing,
+                            use_container_width=True
+                        )
 
 
 # =============================================================================
@@ -395,9 +618,10 @@ with tab1:
             st.metric("Materialer", materials)
 
         with col4:
-            if '_source_file' in df.columns:
-                source_file = df['_source_file'].iloc[0] if len(df) > 0 else "N/A"
-                st.metric("Kildefil", Path(source_file).stem if source_file != "N/A" else "N/A")
+            source_file = df.attrs.get('source_file')
+            if source_file is None and '_source_file' in df.columns and len(df) > 0:
+                source_file = df['_source_file'].iloc[0]
+            st.metric("Kildefil", Path(source_file).stem if source_file else "N/A")
 
         st.markdown("---")
         st.markdown("### Analyse av volum fordelt på material og gjenbruksstatus")
@@ -550,6 +774,13 @@ Ved å endre noen elementer til GJEN (gjenbruk) eller EKS (eksisterende) kan der
 
         # Group by Material, Type, and Gjenbruksstatus
         if 'Material' in df.columns and 'Entity' in df.columns:
+            # Material aggregations split layered elements by layer share (one row per element otherwise)
+            if st.session_state.material_layers is not None:
+                material_df = material_volumes(df, st.session_state.material_layers,
+                                               columns=('Entity', 'Status_Display'))
+            else:
+                material_df = df
+
             # Charts - 3 columns
             col_chart1, col_chart2, col_chart3 = st.columns(3)
 
@@ -557,7 +788,7 @@ Ved å endre noen elementer til GJEN (gjenbruk) eller EKS (eksisterende) kan der
                 st.subheader("📊 Volum etter gjenbruksstatus")
 
                 # Pie chart of status
-                status_totals = df.groupby('Status_Display')['Volume_m3'].sum().reset_index()
+                status_totals = df.groupby('Status_Display', observed=True)['Volume_m3'].sum().reset_index()
                 status_totals = status_totals.sort_values('Volume_m3', ascending=False)
 
                 fig_pie = px.pie(
@@ -579,7 +810,7 @@ Ved å endre noen elementer til GJEN (gjenbruk) eller EKS (eksisterende) kan der
                 st.subheader("📊 Volum etter Type")
 
                 # Bar chart of element types
-                type_totals = df.groupby('Entity')['Volume_m3'].sum().reset_index()
+                type_totals = df.groupby('Entity', observed=True)['Volume_m3'].sum().reset_index()
                 type_totals = type_totals.sort_values('Volume_m3', ascending=False).head(10)
 
                 fig_type = px.bar(
@@ -597,8 +828,8 @@ Ved å endre noen elementer til GJEN (gjenbruk) eller EKS (eksisterende) kan der
             with col_chart3:
                 st.subheader("📊 Volum etter materiale")
 
-                # Bar chart of materials
-                material_totals = df.groupby('Material')['Volume_m3'].sum().reset_index()
+                # Bar chart of materials (layered elements split by layer share)
+                material_totals = material_df.groupby('Material', observed=True)['Volume_m3'].sum().reset_index()
                 material_totals = material_totals.sort_values('Volume_m3', ascending=False).head(10)
 
                 fig_bar = px.bar(
@@ -624,7 +855,7 @@ Ved å endre noen elementer til GJEN (gjenbruk) eller EKS (eksisterende) kan der
                 st.markdown("#### Volum etter elementtype og gjenbruksstatus")
 
                 # Type × Status pivot
-                type_pivot = df.groupby(['Entity', 'Status_Display'])['Volume_m3'].sum().reset_index()
+                type_pivot = df.groupby(['Entity', 'Status_Display'], observed=True)['Volume_m3'].sum().reset_index()
                 type_pivot['Percentage'] = (type_pivot['Volume_m3'] / total_volume * 100)
                 type_pivot = type_pivot.sort_values('Volume_m3', ascending=False)
 
@@ -671,7 +902,7 @@ Ved å endre noen elementer til GJEN (gjenbruk) eller EKS (eksisterende) kan der
                 st.markdown("#### Volum etter materiale og gjenbruksstatus")
 
                 # Material × Status pivot
-                material_pivot = df.groupby(['Material', 'Status_Display'])['Volume_m3'].sum().reset_index()
+                material_pivot = material_df.groupby(['Material', 'Status_Display'], observed=True)['Volume_m3'].sum().reset_index()
                 material_pivot['Percentage'] = (material_pivot['Volume_m3'] / total_volume * 100)
                 material_pivot = material_pivot.sort_values('Volume_m3', ascending=False)
 
@@ -718,7 +949,7 @@ Ved å endre noen elementer til GJEN (gjenbruk) eller EKS (eksisterende) kan der
                 st.markdown("#### Volum etter type, materiale og gjenbruksstatus")
 
                 # Type × Material × Status pivot
-                full_pivot = df.groupby(['Entity', 'Material', 'Status_Display'])['Volume_m3'].sum().reset_index()
+                full_pivot = material_df.groupby(['Entity', 'Material', 'Status_Display'], observed=True)['Volume_m3'].sum().reset_index()
                 full_pivot['Percentage'] = (full_pivot['Volume_m3'] / total_volume * 100)
                 full_pivot = full_pivot.sort_values('Volume_m3', ascending=False)
 
@@ -779,7 +1010,7 @@ with tab2:
                            (df['Material'].str.contains('Concrete|Betong', case=False, na=False))
                     affected = mask.sum()
                     df.loc[mask, gjenbruk_col] = 'GJEN'
-                    st.session_state.df = df
+                    set_session_df(df)
 
                     # Update analysis IFC directly (fast, Solibri sees changes immediately)
                     if st.session_state.current_analysis_ifc:
@@ -800,7 +1031,7 @@ with tab2:
                     mask = df['Material'].str.contains('Steel|Stål', case=False, na=False)
                     affected = mask.sum()
                     df.loc[mask, gjenbruk_col] = 'EKS'
-                    st.session_state.df = df
+                    set_session_df(df)
 
                     # Update analysis IFC directly (fast, Solibri sees changes immediately)
                     if st.session_state.current_analysis_ifc:
@@ -818,7 +1049,7 @@ with tab2:
                     mask = df['Entity'].str.contains('Slab|Dekke', case=False, na=False)
                     affected = mask.sum()
                     df.loc[mask, gjenbruk_col] = 'GJEN'
-                    st.session_state.df = df
+                    set_session_df(df)
 
                     # Update analysis IFC directly (fast, Solibri sees changes immediately)
                     if st.session_state.current_analysis_ifc:
@@ -834,7 +1065,7 @@ with tab2:
         with col_reset2:
             if st.button("🔄 Tilbakestill alle til NY", type="secondary", use_container_width=True):
                 df[gjenbruk_col] = 'NY'
-                st.session_state.df = df
+                set_session_df(df)
 
                 # Update analysis IFC directly
                 if st.session_state.current_analysis_ifc:
@@ -949,7 +1180,7 @@ with tab2:
             if new_status != '(Ikke endre)':
                 df.loc[mask, gjenbruk_col] = new_status
                 # Update session state
-                st.session_state.df = df
+                set_session_df(df)
 
                 # Update analysis IFC directly (fast, Solibri sees changes immediately)
                 if st.session_state.current_analysis_ifc:
@@ -1039,13 +1270,15 @@ with tab2:
                 key="data_editor",
                 column_config=column_config
             )
+            # data_editor returns a new frame without the extraction metadata
+            edited_df.attrs = dict(df.attrs)
 
             # Save changes
             col_save1, col_save2 = st.columns(2)
 
             with col_save1:
                 if st.button("💾 Lagre alle endringer", type="primary"):
-                    st.session_state.df = edited_df
+                    set_session_df(edited_df)
 
                     # Update analysis IFC directly (fast, Solibri sees changes immediately)
                     if st.session_state.current_analysis_ifc:
@@ -1056,18 +1289,14 @@ with tab2:
                         st.success("✅ Endringer lagret i session")
 
             with col_save2:
-                # Download edited data as Excel
-                from io import BytesIO
-                buffer = BytesIO()
-                with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-                    edited_df.to_excel(writer, sheet_name='Elements', index=False)
-                buffer.seek(0)
-
-                st.download_button(
+                # Download edited data as Excel, built on request; pending edits are
+                # part of the key so the workbook is rebuilt only when they change
+                edits = json.dumps(st.session_state.get("data_editor", {}), sort_keys=True, default=str)
+                cached_excel(
+                    'edited_excel_export', (st.session_state.df_version, edits), edited_df,
                     label="📥 Last ned redigert Excel",
-                    data=buffer,
-                    file_name="redigerte_data.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                    prepare_label="📊 Klargjør redigert Excel",
+                    file_name="redigerte_data.xlsx"
                 )
 
     else: